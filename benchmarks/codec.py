@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+'''
+micro benchmark of the installed json codecs on order and menu payloads,
+and of building order payloads from the store template
+
+    python benchmarks/codec.py --items 10 --menu-items 200 --runs 20000
+'''
+import argparse, os, sys, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from codec import available
+from mcdonald import Client
+
+
+def order_payload(client:Client, items:int):
+    order = {"normal": [{"id": 100 + i, "quantity": 1 + i % 3} for i in range(items)],
+        "deals": [{"id": -1, "type": 2, "parts": [{"id": 100, "alias": "Sandwich"}, {"id": 101, "alias": "Side"}]}]}
+    return order, client._generate_json(order, card={"CustomerPaymentMethodId": 1, "PaymentMethodId": 3})
+
+def menu_payload(items:int):
+    return {"category": {"category_id": 1, "category_name": "Breakfast", "items": {"item": [
+        {"item_id": i, "item_name": "Item {} with Egg® and Cheese".format(i), "external_id": str(100 + i),
+            "do_not_show": "Core" if i % 4 else "Promotional", "item_marketing_name": "Item {}".format(i),
+            "nutrient_facts": {"nutrient": [{"id": n, "name": "Nutrient {}".format(n), "value": str(n * 1.5), "uom": "g"}
+                for n in range(8)]}} for i in range(items)]}}}
+
+def timed(f, runs:int):
+    start = time.perf_counter()
+    for _ in range(runs):
+        f()
+    return (time.perf_counter() - start) / runs
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark json codecs and order templates.")
+    parser.add_argument("--items", type=int, default=10, help="product lines per order")
+    parser.add_argument("--menu-items", type=int, default=200, help="items per menu category")
+    parser.add_argument("--runs", type=int, default=20000)
+    args = parser.parse_args()
+
+    client = Client("benchmark")
+    client.username = "benchmark@example.com"
+    client.store = {"id": "1000"}
+    order, payload = order_payload(client, args.items)
+    menu = menu_payload(args.menu_items)
+    menu_runs = max(args.runs // 50, 10)
+
+    print("{:<10} {:>14} {:>14} {:>14} {:>14}".format("codec", "order dumps", "order loads", "menu dumps", "menu loads"))
+    for codec in available():
+        order_bytes = codec.dumps(payload)
+        menu_bytes = codec.dumps(menu)
+        print("{:<10} {:>12.2f}us {:>12.2f}us {:>12.2f}us {:>12.2f}us".format(codec.name,
+            timed(lambda: codec.dumps(payload), args.runs) * 1e6, timed(lambda: codec.loads(order_bytes), args.runs) * 1e6,
+            timed(lambda: codec.dumps(menu), menu_runs) * 1e6, timed(lambda: codec.loads(menu_bytes), menu_runs) * 1e6))
+
+    print("_generate_json {:.2f}us per order of {} lines".format(timed(lambda: client._generate_json(order), args.runs) * 1e6, args.items))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+'''
+end to end benchmarks of the main client flows against a local stand in
+server (or a replay adapter), reporting throughput and p50 / p99 latency.
+
+    python benchmarks/flows.py --latency 0.02 --iterations 200 --concurrency 8
+    python benchmarks/flows.py --cassette recorded.json
+'''
+import argparse, json, os, sys, time
+from concurrent.futures import ThreadPoolExecutor
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mcdonald import Client
+from transport import Cassette, ReplayAdapter, StandInServer
+
+ORDER = {"normal": [{"id": 100, "quantity": 2}, {"id": 101, "quantity": 1}], "deals": []}
+
+
+def _store(i:int):
+    return {"generalStatus": {"status": "OPEN"},
+        "address": {"addressLine1": "{} Main St".format(i), "cityTown": "Urbana", "subdivision": "IL", "postalZip": "61801",
+            "location": {"lat": str(40.1 + i * 0.01), "lon": str(-88.2 - i * 0.01)}},
+        "identifiers": {"storeIdentifier": [{"identifierValue": "x"}, {"identifierValue": str(1000 + i)}]},
+        "storeNumbers": {"phonenumber": [{"number": "217-555-0100"}]}}
+
+def synthetic_cassette(stores:int=25, categories:int=10, items:int=20):
+    '''
+    a cassette shaped like the real api responses, for when nothing was recorded
+    '''
+    cassette = Cassette()
+    def add(method, endpoint, body, url=None):
+        cassette.add(method, url or getattr(Client, endpoint), 200, {"Content-Type": "application/json"}, json.dumps(body))
+    ok = {"ResultCode": 1}
+    add("POST", "SIGN_IN", {**ok, "Data": {"AccessData": {"Token": "token"}, "CustomerData": {"ZipCode": "61801"}}})
+    add("GET", "STORES", [_store(i) for i in range(stores)])
+    add("GET", "STORE_INFO", {**ok, "Data": {"OutageProductCodes": ["101"]}})
+    add("GET", "MENU_CATEGORIES", {"categories": {"category": [{"category_id": i} for i in range(categories)]}})
+    add("GET", "MENU_CATEGORY", {"category": {"category_name": "Category", "items": {"item": [
+        {"item_name": "Item {}".format(i), "external_id": str(100 + i), "do_not_show": "Core"} for i in range(items)]}}})
+    add("GET", "PROFILE", {**ok, "Data": {"PaymentCard": [{"CustomerPaymentMethodId": 1, "PaymentMethodId": 3}]}})
+    add("POST", "ORDER_TOTAL", {**ok, "Data": {"OrderView": {"TotalValue": 5.37}}})
+    add("POST", "ORDER_INITIAL", {"OrderView": {"OrderPaymentId": 1, "TotalValue": 5.37, "CheckInCode": "1234"}})
+    add("GET", "ORDER_PICKUP", ok, Client.ORDER_PICKUP.format("1234"))
+    add("POST", "ORDER_INITIAL_CONFIRM", ok, Client.ORDER_INITIAL_CONFIRM.format("1234"))
+    add("POST", "ORDER_FINAL", {"OrderNumber": 42}, Client.ORDER_FINAL.format("1234"))
+    return cassette
+
+def percentile(values:list, p:float):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def run(name:str, flow, make_client, iterations:int, concurrency:int):
+    def one(_):
+        client = make_client()
+        start = time.perf_counter()
+        flow(client)
+        return time.perf_counter() - start
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        durations = list(pool.map(one, range(iterations)))
+    elapsed = time.perf_counter() - start
+    print("{:<14} {:>8.1f}/s  p50 {:>7.1f}ms  p99 {:>7.1f}ms".format(
+        name, iterations / elapsed, percentile(durations, 50) * 1000, percentile(durations, 99) * 1000))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark client flows offline.")
+    parser.add_argument("--cassette", help="recorded cassette, a synthetic one is used by default")
+    parser.add_argument("--latency", type=float, default=0.01, help="seconds the stand in server waits per request")
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--replay", action="store_true", help="use the replay adapter instead of the local server")
+    parser.add_argument("--menu-workers", type=int, default=4)
+    args = parser.parse_args()
+
+    cassette = Cassette.load(args.cassette) if args.cassette else synthetic_cassette()
+    server = None
+    if args.replay:
+        adapter = ReplayAdapter(cassette, latency=args.latency)
+        def make_client():
+            client = Client("benchmark", adapter=adapter)
+            client.sign_in("benchmark@example.com", "password")
+            return client
+    else:
+        server = StandInServer(cassette, latency=args.latency).start()
+        def make_client():
+            client = Client("benchmark", base=server.base)
+            client.sign_in("benchmark@example.com", "password")
+            return client
+    store = make_client().find_stores("40.1", "-88.2")[0]
+    card = make_client().cards()[0]
+    def order_and_pickup(client):
+        client.order(card, ORDER, store=store)
+        client.pickup()
+    flows = [
+        ("find_stores", lambda client: client.find_stores("40.1", "-88.2")),
+        ("menu", lambda client: client.menu(store, workers=args.menu_workers)),
+        ("get_price", lambda client: (setattr(client, "store", store), client.get_price(ORDER))),
+        ("order+pickup", order_and_pickup),
+    ]
+    try:
+        for name, flow in flows:
+            run(name, flow, make_client, args.iterations, args.concurrency)
+    finally:
+        if server:
+            server.stop()
+
+if __name__ == '__main__':
+    main()
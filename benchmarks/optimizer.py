@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+'''
+benchmarks optimizer.cheapest_order over synthetic offer sets, with a local
+price table and with a counting stand in for ORDER_TOTAL quotes
+
+    python benchmarks/optimizer.py --offers 20 --basket 6 --runs 50
+'''
+import argparse, os, random, sys, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models import Offer
+from optimizer import PriceTable, cheapest_order
+
+
+def synthetic(products:int, offers:int, seed:int):
+    rng = random.Random(seed)
+    codes = [str(1000 + i) for i in range(products)]
+    prices = {code: round(rng.uniform(1, 6), 2) for code in codes}
+    offer_list = []
+    deals = {}
+    for i in range(offers):
+        product_sets = [{"Alias": "Item {}".format(j + 1), "AnyProduct": rng.random() < 0.1,
+                "Products": rng.sample(codes, rng.randint(1, 5)), "Action": {"DiscountType": 1}}
+                for j in range(rng.randint(1, 2))]
+        offer_list.append(Offer({"Id": -(i + 1), "Name": "Offer {}".format(i + 1), "ProductSets": product_sets}))
+        deals[-(i + 1)] = round(rng.uniform(1, 8), 2)
+    return codes, prices, deals, offer_list
+
+class CountingQuotes(object):
+    '''
+    prices like the table but counts how many orders would be quoted remotely
+    '''
+    def __init__(self, table:PriceTable):
+        self.table = table
+        self.quoted = 0
+
+    def price_many(self, orders:list):
+        self.quoted += len(orders)
+        return self.table.price_many(orders)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cheapest order search.")
+    parser.add_argument("--products", type=int, default=40)
+    parser.add_argument("--offers", type=int, default=20)
+    parser.add_argument("--basket", type=int, default=6)
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    codes, prices, deals, offers = synthetic(args.products, args.offers, args.seed)
+    table = PriceTable(prices, deals)
+    rng = random.Random(args.seed)
+    baskets = [[rng.choice(codes) for _ in range(args.basket)] for _ in range(args.runs)]
+
+    start = time.perf_counter()
+    savings = 0
+    for basket in baskets:
+        total, order = cheapest_order(basket, offers, table)
+        savings += sum(prices[code] for code in basket) - total
+    elapsed = time.perf_counter() - start
+    print("price table   {:>8.2f}ms per basket, {:.2f} saved on average".format(elapsed / args.runs * 1000, savings / args.runs))
+
+    quotes = CountingQuotes(table)
+    start = time.perf_counter()
+    misses = 0
+    for basket in baskets:
+        total, _ = cheapest_order(basket, offers, quotes)
+        best, _ = cheapest_order(basket, offers, table)
+        misses += abs(total - best) > 1e-9
+    elapsed = time.perf_counter() - start
+    print("quotes        {:>8.2f}ms per basket, {:.1f} quotes per basket, {} of {} worse than the table optimum".format(
+        elapsed / args.runs * 1000, quotes.quoted / args.runs, misses, args.runs))
+
+if __name__ == '__main__':
+    main()
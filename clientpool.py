@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+import queue, threading, time
+from contextlib import contextmanager
+from requests.adapters import HTTPAdapter
+from mcdonald import Client, McDonaldsError
+
+
+class ClientPool(object):
+    '''
+    signed in clients for many accounts sharing one connection pool.
+    clients are leased to one thread at a time and signed in again
+    when their token is older than token_ttl. a token that expires sooner
+    is renewed by the client itself when a call gets a 401
+    '''
+    def __init__(self, api_key:str, accounts:list, pool_connections:int=10, pool_maxsize:int=None, token_ttl:float=None, **client_kwargs):
+        self.adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize or max(len(accounts), 10))
+        self.token_ttl = token_ttl
+        self.accounts = {}
+        self.signed_in = {}
+        self.lock = threading.Lock()
+        self.idle = queue.Queue()
+        for username, password in accounts:
+            client = Client(api_key, adapter=self.adapter, **client_kwargs)
+            self.accounts[client] = (username, password)
+            self.signed_in[client] = None
+            self.idle.put(client)
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def _ensure_signed_in(self, client:Client):
+        signed_in = self.signed_in[client]
+        if signed_in is None or (self.token_ttl and time.time() - signed_in > self.token_ttl):
+            client.sign_in(*self.accounts[client])
+            with self.lock:
+                self.signed_in[client] = time.time()
+
+    def expire(self, client:Client):
+        '''
+        makes the client sign in again the next time it is leased
+        '''
+        with self.lock:
+            self.signed_in[client] = None
+
+    @contextmanager
+    def lease(self, timeout:float=None):
+        '''
+        waits for an idle client and yields it signed in, then returns it to the pool
+        '''
+        try:
+            client = self.idle.get(timeout=timeout)
+        except queue.Empty:
+            raise McDonaldsError("No client available in the pool.")
+        try:
+            self._ensure_signed_in(client)
+            yield client
+        finally:
+            self.idle.put(client)
+
+    def run(self, f, *args, **kwargs):
+        '''
+        calls f(client, *args, **kwargs) with a leased client
+        '''
+        with self.lease() as client:
+            return f(client, *args, **kwargs)
+
+    def close(self):
+        self.adapter.close()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+import json
+from models import json_default
+
+
+class JsonCodec(object):
+    '''
+    encodes request bodies to bytes and decodes response bodies, the stdlib
+    json module. the faster codecs below are used when installed
+    '''
+    name = "json"
+
+    def dumps(self, obj):
+        return json.dumps(obj, separators=(",", ":"), default=json_default).encode()
+
+    def loads(self, data):
+        return json.loads(data)
+
+class OrjsonCodec(JsonCodec):
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+        self._dumps = orjson.dumps
+        self.loads = orjson.loads
+
+    def dumps(self, obj):
+        return self._dumps(obj, default=json_default)
+
+class MsgspecCodec(JsonCodec):
+    name = "msgspec"
+
+    def __init__(self):
+        import msgspec
+        self.dumps = msgspec.json.Encoder(enc_hook=json_default).encode
+        self.loads = msgspec.json.Decoder().decode
+
+class UjsonCodec(JsonCodec):
+    name = "ujson"
+
+    def __init__(self):
+        import ujson
+        self.loads = ujson.loads
+        self._dumps = ujson.dumps
+
+    def dumps(self, obj):
+        return self._dumps(obj, ensure_ascii=False, default=json_default).encode()
+
+CODECS = (OrjsonCodec, MsgspecCodec, UjsonCodec, JsonCodec)
+
+def get_codec(name:str=None):
+    '''
+    returns the codec with that name, or the fastest one installed
+    '''
+    for codec in CODECS:
+        if name is None or codec.name == name:
+            try:
+                return codec()
+            except ImportError:
+                if name is not None:
+                    raise
+    raise ValueError("unknown codec {}".format(name))
+
+def available():
+    '''
+    returns every codec that is installed
+    '''
+    codecs = []
+    for codec in CODECS:
+        try:
+            codecs.append(codec())
+        except ImportError:
+            pass
+    return codecs
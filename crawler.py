@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+'''
+crawls stores, menus and offers over a coordinate grid with a process pool,
+appending one json line per store. progress is checkpointed next to the
+output so an interrupted crawl resumes where it stopped.
+
+    python crawler.py API_KEY USERNAME PASSWORD --bounds 40 -89 42 -87 --out illinois.jsonl --workers 8 --budget 20000
+'''
+import json, math, multiprocessing, os, sys, time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from mcdonald import BudgetExhausted, Client, McDonaldsError, MenuCache, RequestBudget, TokenStore
+from models import json_default
+
+MILES_PER_DEGREE = 69.0
+
+
+def grid(south:float, west:float, north:float, east:float, step:float=10):
+    '''
+    returns (latitude, longitude) cell centers about step miles apart covering the bounds
+    '''
+    cells = []
+    latitude = south
+    while latitude <= north:
+        step_lon = step / (MILES_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+        longitude = west
+        while longitude <= east:
+            cells.append((round(latitude, 6), round(longitude, 6)))
+            longitude += step_lon
+        latitude += step / MILES_PER_DEGREE
+    return cells
+
+_client = None
+
+def _init_worker(api_key:str, username:str, password:str, budget, client_kwargs:dict):
+    global _client
+    client = Client(api_key, menu_cache=MenuCache(), budget=RequestBudget(value=budget) if budget is not None else None, **client_kwargs)
+    try:
+        client.sign_in(username, password)
+    except BudgetExhausted:
+        return
+    _client = client
+
+def _find(cells:list, range:float):
+    '''
+    finds the stores around each (index, latitude, longitude) cell, returns
+    the indexes done, the stores found and any errors
+    '''
+    done, stores, errors = [], [], []
+    for index, latitude, longitude in cells:
+        if _client is None:
+            break
+        try:
+            found = _client.find_stores(latitude, longitude, range)
+        except BudgetExhausted:
+            break
+        except (McDonaldsError, OSError, ValueError, KeyError, TypeError) as e: # one bad cell or store is logged, not fatal
+            errors.append("cell {}: {}: {}".format(index, type(e).__name__, e))
+            continue
+        stores.extend({key: value for key, value in store.items() if key != "distance"} for store in found)
+        done.append(index)
+    return done, stores, errors
+
+def _details(stores:list, offers:bool):
+    '''
+    fetches the menu, and offers if asked, of each store
+    '''
+    records, errors = [], []
+    for store in stores:
+        if _client is None:
+            break
+        try:
+            record = {"market": _client.market, "language": _client.language, "time": time.time(), "store": store,
+                    "menu": _client.menu(store)}
+            if offers:
+                record["offers"] = _client.offers(store)
+        except BudgetExhausted:
+            break
+        except (McDonaldsError, OSError, ValueError, KeyError, TypeError) as e:
+            errors.append("store {}: {}: {}".format(store["id"], type(e).__name__, e))
+            continue
+        records.append(record)
+    return records, errors
+
+class Crawler(object):
+    '''
+    shards the grid cells across workers processes. new stores are sent off
+    for their menus as soon as a cell finds them, and each store is only
+    crawled once per market and language, so crawls of several markets can
+    share one output file. budget caps the api calls of the whole crawl,
+    each call is taken from it before it is sent
+    '''
+    def __init__(self, api_key:str, username:str, password:str, out:str, bounds:tuple, step:float=10, range:float=8,
+            workers:int=4, budget:int=None, chunk_size:int=8, offers:bool=True, **client_kwargs):
+        self.api_key = api_key
+        self.username = username
+        self.password = password
+        self.out = out
+        self.market = client_kwargs.get("market", "US")
+        self.language = client_kwargs.get("language", "en-US")
+        self.checkpoint = "{}.{}.{}.checkpoint".format(out, self.market, self.language)
+        self.bounds = list(bounds)
+        self.step = step
+        self.range = range
+        self.workers = workers
+        self.budget = budget
+        self.chunk_size = chunk_size
+        self.offers = offers
+        self.client_kwargs = client_kwargs
+        self.cells = grid(*self.bounds, step)
+
+    def _grid(self):
+        return self.bounds + [self.step, self.range, self.market, self.language, self.offers]
+
+    def _key(self, store):
+        return (self.market, self.language, store["id"])
+
+    def _load(self):
+        '''
+        returns the done cells and pending stores from the checkpoint, and the
+        (market, language, store id) of the stores already written
+        '''
+        done_cells, pending = set(), {}
+        if os.path.exists(self.checkpoint):
+            with open(self.checkpoint) as f:
+                state = json.load(f)
+            if state["grid"] != self._grid():
+                raise ValueError("{} was made for another grid, market or language".format(self.checkpoint))
+            done_cells = set(state["cells"])
+            pending = state["pending"]
+        written = set()
+        if os.path.exists(self.out):
+            with open(self.out) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        written.add((record["market"], record["language"], record["store"]["id"]))
+                    except ValueError: # a line cut off by an interrupted run
+                        pass
+        return done_cells, pending, written
+
+    def _save(self, done_cells:set, pending:dict):
+        temporary = self.checkpoint + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump({"grid": self._grid(), "cells": sorted(done_cells), "pending": pending}, f)
+        os.replace(temporary, self.checkpoint)
+
+    def run(self, log=sys.stderr):
+        '''
+        crawls until every cell and store is done or the budget runs out,
+        returns a summary of the crawl
+        '''
+        done_cells, pending, written = self._load()
+        todo = [(i, latitude, longitude) for i, (latitude, longitude) in enumerate(self.cells) if i not in done_cells]
+        for market, language, id in written:
+            if (market, language) == (self.market, self.language):
+                pending.pop(id, None)
+        budget = multiprocessing.Value("q", self.budget) if self.budget is not None else None
+        written_now = 0
+        with open(self.out, "a") as out, ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                initargs=(self.api_key, self.username, self.password, budget, self.client_kwargs)) as pool:
+            running = {}
+            def submit_stores(stores):
+                for i in range(0, len(stores), self.chunk_size):
+                    running[pool.submit(_details, stores[i:i+self.chunk_size], self.offers)] = "stores"
+            for i in range(0, len(todo), self.chunk_size):
+                running[pool.submit(_find, todo[i:i+self.chunk_size], self.range)] = "cells"
+            submit_stores(list(pending.values()))
+            while running:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    kind = running.pop(future)
+                    if kind == "cells":
+                        done, stores, errors = future.result()
+                        done_cells.update(done)
+                        new = {}
+                        for store in stores:
+                            if self._key(store) not in written and store["id"] not in pending and store["id"] not in new:
+                                new[store["id"]] = store
+                        pending.update(new)
+                        submit_stores(list(new.values()))
+                    else:
+                        records, errors = future.result()
+                        for record in records:
+                            if self._key(record["store"]) not in written:
+                                out.write(json.dumps(record, default=json_default) + "\n")
+                                written.add(self._key(record["store"]))
+                                written_now += 1
+                            pending.pop(record["store"]["id"], None)
+                        out.flush()
+                    for error in errors:
+                        print(error, file=log)
+                    self._save(done_cells, pending)
+        stores = sum(1 for market, language, _ in written if (market, language) == (self.market, self.language))
+        summary = {"cells": len(done_cells), "total_cells": len(self.cells), "stores": stores, "new_stores": written_now,
+                "pending_stores": len(pending)}
+        if budget is not None:
+            summary["requests"] = self.budget - budget.value
+        return summary
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Crawl mcdonalds stores, menus and offers over an area.")
+    parser.add_argument("api_key")
+    parser.add_argument("username")
+    parser.add_argument("password")
+    parser.add_argument("--bounds", type=float, nargs=4, required=True, metavar=("SOUTH", "WEST", "NORTH", "EAST"))
+    parser.add_argument("--out", required=True, help="json lines file the stores are appended to, resumed if it exists")
+    parser.add_argument("--step", type=float, default=10, help="miles between grid cells")
+    parser.add_argument("--range", type=float, default=8, help="store search range in miles around each cell")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--budget", type=int, help="most api calls for this run")
+    parser.add_argument("--chunk-size", type=int, default=8, help="cells or stores per task")
+    parser.add_argument("--no-offers", action="store_true", help="skip fetching offers")
+    parser.add_argument("--market", default="US")
+    parser.add_argument("--language", default="en-US")
+    parser.add_argument("--token-store", help="file to save the sign in token in, shared by the workers")
+    args = parser.parse_args()
+    crawler = Crawler(args.api_key, args.username, args.password, args.out, args.bounds, step=args.step, range=args.range,
+            workers=args.workers, budget=args.budget, chunk_size=args.chunk_size, offers=not args.no_offers,
+            market=args.market, language=args.language, token_store=TokenStore(args.token_store) if args.token_store else None)
+    print(json.dumps(crawler.run()))
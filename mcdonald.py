@@ -1,10 +1,588 @@
 #!/usr/bin/env python3
-import requests, json, math, sys, urllib3
+import json, math
+import os, time, hashlib, threading, bisect, functools, random
+from email.utils import parsedate_to_datetime
+from array import array
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from models import BoundedDict, Store, Menu, Offer
+from codec import get_codec
 
 
 class McDonaldsError(Exception):
     pass
-    
+
+class BudgetExhausted(McDonaldsError):
+    pass
+
+class TTLCache(object):
+    '''
+    thread safe in memory cache with a ttl and lru eviction, counting hits and misses
+    '''
+    def __init__(self, ttl:float=300, max_entries:int=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        '''
+        returns the cached value for key or None if it is missing or expired
+        '''
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and time.time() - entry[0] < self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self.entries[key]
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        with self.lock:
+            self._store(key, time.time(), value)
+
+    def _store(self, key, created:float, value):
+        self.entries[key] = (created, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        '''
+        returns hit / miss counters, to help tune the ttl
+        '''
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "entries": len(self.entries)}
+
+class MenuCache(TTLCache):
+    '''
+    caches menu catalogs (the menu before store outages are removed) in
+    memory with a ttl and lru eviction, and optionally in a directory on disk
+    '''
+    def __init__(self, ttl:float=3600, max_entries:int=32, path:str=None):
+        super().__init__(ttl, max_entries)
+        self.path = path
+        self.disk_hits = 0
+        if path:
+            os.makedirs(path, exist_ok=True)
+
+    def _file(self, key):
+        return os.path.join(self.path, hashlib.sha1(json.dumps(key).encode()).hexdigest() + ".json")
+
+    def get(self, key):
+        catalog = super().get(key)
+        if catalog is not None or not self.path:
+            return catalog
+        try:
+            with open(self._file(key)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry["time"] >= self.ttl:
+            return None
+        with self.lock:
+            self._store(key, entry["time"], entry["catalog"])
+            # counted as a miss above, it is a disk hit instead
+            self.misses -= 1
+            self.disk_hits += 1
+        return entry["catalog"]
+
+    def put(self, key, catalog):
+        now = time.time()
+        with self.lock:
+            self._store(key, now, catalog)
+        if self.path:
+            # write then rename so readers never see half a file
+            tmp = self._file(key) + ".{}.tmp".format(os.getpid())
+            with open(tmp, "w") as f:
+                json.dump({"time": now, "key": key, "catalog": catalog}, f)
+            os.replace(tmp, self._file(key))
+
+    def stats(self):
+        stats = super().stats()
+        with self.lock:
+            stats["disk_hits"] = self.disk_hits
+        return stats
+
+class RateLimiter(object):
+    '''
+    token bucket allowing rate requests per second with bursts of up to burst
+    requests. one limiter can be shared by many clients
+    '''
+    def __init__(self, rate:float, burst:int=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        '''
+        takes a token and returns how many seconds to wait before using it
+        '''
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(0, -self.tokens / self.rate)
+
+class RequestBudget(object):
+    '''
+    caps how many api calls the clients sharing it may send, a call is
+    taken from the budget before it is sent. pass a multiprocessing.Value
+    to share one budget across processes
+    '''
+    def __init__(self, calls:int=0, value=None):
+        self.value = value
+        self.calls = calls
+        self.lock = value.get_lock() if value is not None else threading.Lock()
+
+    def remaining(self):
+        return self.value.value if self.value is not None else self.calls
+
+    def take(self):
+        '''
+        takes one call, raises BudgetExhausted when none are left
+        '''
+        with self.lock:
+            if self.remaining() <= 0:
+                raise BudgetExhausted("The request budget is spent.")
+            if self.value is not None:
+                self.value.value -= 1
+            else:
+                self.calls -= 1
+
+class RetryPolicy(object):
+    '''
+    how often and how long to wait before retrying a failed idempotent request,
+    using exponential backoff with full jitter unless the api sends Retry-After
+    '''
+    def __init__(self, attempts:int=3, backoff:float=0.5, max_backoff:float=30, statuses:tuple=(429, 500, 502, 503, 504)):
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.statuses = statuses
+
+    def delay(self, attempt:int, retry_after:str=None):
+        if retry_after:
+            try:
+                return min(self.max_backoff, max(0, float(retry_after)))
+            except ValueError:
+                try:
+                    return min(self.max_backoff, max(0, parsedate_to_datetime(retry_after).timestamp() - time.time()))
+                except (TypeError, ValueError):
+                    pass
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+class CircuitBreaker(object):
+    '''
+    fails fast after failures consecutive errors, letting one request
+    through again after reset_after seconds to check if the api recovered
+    '''
+    def __init__(self, failures:int=5, reset_after:float=30):
+        self.failures = failures
+        self.reset_after = reset_after
+        self.count = 0
+        self.opened = None
+        self.lock = threading.Lock()
+
+    def check(self):
+        with self.lock:
+            if self.opened is None:
+                return
+            if time.monotonic() - self.opened < self.reset_after:
+                raise McDonaldsError("api.mcd.com is failing, not sending requests for {:.1f}s.".format(self.reset_after - (time.monotonic() - self.opened)))
+            # half open, let this request try and wait for the others
+            self.opened = time.monotonic()
+
+    def success(self):
+        with self.lock:
+            self.count = 0
+            self.opened = None
+
+    def failure(self):
+        with self.lock:
+            self.count += 1
+            if self.count >= self.failures:
+                self.opened = time.monotonic()
+
+class TokenStore(object):
+    '''
+    saves sign in tokens to a json file keyed by market and username so a
+    new client can skip signing in. the file is locked while it is updated
+    '''
+    def __init__(self, path:str, ttl:float=86400):
+        self.path = path
+        self.ttl = ttl
+
+    @contextmanager
+    def _locked(self):
+        with open(self.path + ".lock", "a") as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, sessions):
+        tmp = self.path + ".{}.tmp".format(os.getpid())
+        # tokens are bearer credentials, only the owner may read them
+        with os.fdopen(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+            json.dump(sessions, f)
+        os.replace(tmp, self.path)
+
+    @staticmethod
+    def _key(market:str, username:str):
+        return "{}:{}".format(market, username)
+
+    def get(self, market:str, username:str):
+        '''
+        returns the saved {"token", "zip_code", "expires"} or None if missing or expired
+        '''
+        with self._locked():
+            session = self._read().get(self._key(market, username))
+        if session and session["expires"] > time.time():
+            return session
+        return None
+
+    def put(self, market:str, username:str, token:str, zip_code:str):
+        with self._locked():
+            sessions = self._read()
+            sessions[self._key(market, username)] = {"token": token, "zip_code": zip_code, "expires": time.time() + self.ttl}
+            self._write(sessions)
+
+    def delete(self, market:str, username:str):
+        with self._locked():
+            sessions = self._read()
+            if sessions.pop(self._key(market, username), None):
+                self._write(sessions)
+
+class TamuGeocoder(object):
+    '''
+    looks up zip codes with the geoservices.tamu.edu web service.
+    the demo key is rate limited and bans ips that use it too much.
+    a client given the geocoder sends the lookups as its ZIP_LOOKUP
+    endpoint, so they are rate limited, retried and observed like other calls
+    '''
+    def __init__(self, url:str, api_key:str="demo", client=None):
+        self.url = url
+        self.api_key = api_key
+        self.client = client
+        self.session = None
+
+    def lookup(self, zip_code):
+        payload = {
+                "apikey":self.api_key,
+                "format":"json",
+                "version":"4.01",
+                "zip":zip_code
+        }
+        if self.client is not None:
+            response = self.client._zip_request(self.url, payload)
+        else:
+            if self.session is None:
+                import requests
+                self.session = requests.Session()
+            response = self.session.get(self.url, params=payload).json()
+        geocode = response["OutputGeocodes"][0]["OutputGeocode"]
+        if geocode["Latitude"] == "0" and geocode["Longitude"] == "0":
+            raise McDonaldsError("geoservices.tamu.edu has banned your ip (apikey = {}).".format(self.api_key))
+        return geocode["Latitude"], geocode["Longitude"]
+
+class ZipTableGeocoder(object):
+    '''
+    looks up zip code centroids from a local table, loaded on first use.
+    path is a csv / tab separated file with zip, latitude and longitude columns
+    (the census ZCTA gazetteer file works as is), or a .bin file made by compile
+    '''
+    ZIP_COLUMNS = ("zip", "zipcode", "zip_code", "geoid")
+    LAT_COLUMNS = ("lat", "latitude", "intptlat")
+    LON_COLUMNS = ("lon", "lng", "longitude", "intptlong")
+
+    def __init__(self, path:str):
+        self.path = path
+        self.table = None # (zips, latitudes, longitudes), set in one assignment once loaded
+        self.lock = threading.Lock()
+
+    def _load(self):
+        with self.lock:
+            if self.table is None:
+                self.table = self._read_bin(self.path) if self.path.endswith(".bin") else self._read_table(self.path)
+            return self.table
+
+    @classmethod
+    def _read_table(cls, path:str):
+        rows = []
+        with open(path) as f:
+            header = f.readline()
+            delimiter = "\t" if "\t" in header else ","
+            columns = [column.strip().lower() for column in header.split(delimiter)]
+            zip_column = next(columns.index(c) for c in cls.ZIP_COLUMNS if c in columns)
+            lat_column = next(columns.index(c) for c in cls.LAT_COLUMNS if c in columns)
+            lon_column = next(columns.index(c) for c in cls.LON_COLUMNS if c in columns)
+            for line in f:
+                fields = line.split(delimiter)
+                if len(fields) == len(columns):
+                    rows.append((int(fields[zip_column]), float(fields[lat_column]), float(fields[lon_column])))
+        rows.sort()
+        return array("I", (row[0] for row in rows)), array("d", (row[1] for row in rows)), array("d", (row[2] for row in rows))
+
+    @staticmethod
+    def _read_bin(path:str):
+        zips, latitudes, longitudes = array("I"), array("d"), array("d")
+        with open(path, "rb") as f:
+            count = array("I")
+            count.fromfile(f, 1)
+            zips.fromfile(f, count[0])
+            latitudes.fromfile(f, count[0])
+            longitudes.fromfile(f, count[0])
+        return zips, latitudes, longitudes
+
+    @classmethod
+    def compile(cls, table_path:str, bin_path:str):
+        '''
+        converts a csv table into the compact .bin format, which loads much faster
+        '''
+        zips, latitudes, longitudes = cls._read_table(table_path)
+        with open(bin_path, "wb") as f:
+            array("I", [len(zips)]).tofile(f)
+            zips.tofile(f)
+            latitudes.tofile(f)
+            longitudes.tofile(f)
+
+    def lookup(self, zip_code):
+        '''
+        returns (latitude, longitude) or None if the zip code is not in the table
+        '''
+        table = self.table or self._load()
+        zips, latitudes, longitudes = table
+        zip_code = int(str(zip_code)[:5])
+        i = bisect.bisect_left(zips, zip_code)
+        if i < len(zips) and zips[i] == zip_code:
+            return latitudes[i], longitudes[i]
+        return None
+
+class FallbackGeocoder(object):
+    '''
+    tries each geocoder in turn until one finds the zip code
+    '''
+    def __init__(self, *geocoders):
+        self.geocoders = geocoders
+
+    def lookup(self, zip_code):
+        for geocoder in self.geocoders:
+            coordinates = geocoder.lookup(zip_code)
+            if coordinates:
+                return coordinates
+        return None
+
+class JsonArrayParser(object):
+    '''
+    parses a json array fed in text chunks as it downloads, feed returns
+    the items completed by each chunk. close raises if the array never ended
+    '''
+    def __init__(self):
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.started = False
+        self.done = False
+
+    def feed(self, text:str):
+        items = []
+        buffer = self.buffer + text
+        position = 0
+        while not self.done:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position == len(buffer):
+                break
+            if not self.started:
+                if buffer[position] != "[":
+                    raise ValueError("expected a json array")
+                self.started = True
+                position += 1
+                continue
+            if buffer[position] == "]":
+                self.done = True
+                position += 1
+                break
+            try:
+                item, end = self.decoder.raw_decode(buffer, position)
+            except ValueError: # the item is not fully downloaded yet
+                break
+            if buffer[position] not in "{[\"" and (end == len(buffer) or buffer[end] not in " \t\r\n,]"):
+                break # a number or literal can go on in the next chunk
+            items.append(item)
+            position = end
+        self.buffer = buffer[position:]
+        return items
+
+    def close(self):
+        if not self.done:
+            raise ValueError("json array ended early")
+
+class Checkout(object):
+    '''
+    one order going through order -> confirm -> finalize. everything about
+    the order is kept here instead of on the client, so one signed in client
+    can have many orders in flight. each step is sent at most once: repeating
+    a finished step does nothing, and a step that failed leaves the checkout
+    "failed" since the api may already have taken it
+    '''
+    STEPS = ("place", "confirm", "finalize")
+    STATES = ("new", "placed", "confirmed", "finalized")
+
+    def __init__(self, client, card, food, store):
+        self.client = client
+        self.card = card
+        self.food = food
+        self.store = store
+        self.state = "new"
+        self.error = None
+        self.timings = {}
+        self.total = None
+        self.order_payment_id = None
+        self.check_in_code = None
+        self.order_number = None
+        self._lock = threading.Lock()
+
+    @property
+    def done(self):
+        return self.state in ("finalized", "failed")
+
+    def _should_run(self, name:str):
+        '''
+        whether step name is next, false if it already ran
+        '''
+        if self.state == "failed":
+            raise McDonaldsError("Checkout failed at an earlier step: {}".format(self.error))
+        done = self.STATES.index(self.state)
+        wanted = self.STEPS.index(name)
+        if wanted > done:
+            raise McDonaldsError("Cannot {} before {}.".format(name, self.STEPS[done]))
+        return wanted == done
+
+    def _finished(self, name:str, start:float, error:Exception=None):
+        self.timings[name] = time.perf_counter() - start
+        if error is not None:
+            self.state = "failed"
+            self.error = error
+        else:
+            self.state = self.STATES[self.STEPS.index(name) + 1]
+
+    def _step(self, name:str, f):
+        with self._lock:
+            if not self._should_run(name):
+                return
+            start = time.perf_counter()
+            try:
+                f()
+            except Exception as e:
+                self._finished(name, start, e)
+                raise
+            self._finished(name, start)
+
+    def _placed(self, response):
+        self.order_payment_id = response['OrderView']['OrderPaymentId']
+        self.total = response['OrderView']['TotalValue']
+        self.check_in_code = response["OrderView"]["CheckInCode"]
+
+    def _place_payload(self):
+        return self.client._generate_json(self.food, card=self.card, store=self.store)
+
+    def _final_payload(self):
+        return self.client._final_payload(self.order_payment_id, self.card, self.store)
+
+    def place(self):
+        '''
+        sends the order, ORDER_INITIAL
+        '''
+        self._step("place", lambda: self._placed(self.client._request("post", "ORDER_INITIAL", json=self._place_payload())))
+
+    def confirm(self):
+        '''
+        CHARGES PAYMENT METHOD, ORDER_INITIAL_CONFIRM
+        '''
+        def confirm():
+            self.client._get_order_pickup(self.check_in_code)
+            self.client._request("post", "ORDER_INITIAL_CONFIRM", self.check_in_code, json=self.client._confirm_payload(self.store))
+        self._step("confirm", confirm)
+
+    def finalize(self):
+        '''
+        ORDER_FINAL, returns the order number
+        '''
+        def finalize():
+            self.client._get_order_pickup(self.check_in_code)
+            response = self.client._request("post", "ORDER_FINAL", self.check_in_code, json=self._final_payload())
+            self.order_number = response["OrderNumber"]
+        self._step("finalize", finalize)
+        return self.order_number
+
+    def advance(self):
+        '''
+        runs the next step, if any
+        '''
+        if not self.done:
+            getattr(self, self.STEPS[self.STATES.index(self.state)])()
+
+    def run(self):
+        '''
+        runs the remaining steps and returns the order number
+        '''
+        while not self.done:
+            self.advance()
+        return self.order_number
+
+class CheckoutExecutor(object):
+    '''
+    advances many checkouts concurrently. every step is its own task, so
+    while one order waits on its confirm others are being placed or finalized.
+    a failed checkout keeps its error and does not stop the others
+    '''
+    def __init__(self, workers:int=8):
+        self.workers = workers
+
+    def run(self, checkouts:list):
+        '''
+        runs every checkout to the end, returns them in the same order
+        '''
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = {pool.submit(checkout.advance): checkout for checkout in checkouts if not checkout.done}
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    checkout = pending.pop(future)
+                    if future.exception() is None and not checkout.done:
+                        pending[pool.submit(checkout.advance)] = checkout
+        return checkouts
+
 class Client(object):
     BASE = "https://api.mcd.com/v3"
     SIGN_IN = BASE + "/customer/session/sign-in-and-authenticate"
@@ -22,8 +600,9 @@ class Client(object):
     ORDER_FINAL = ORDER_INITIAL_CONFIRM + "/unattended" # format
     PROFILE = BASE + '/customer/profile'
     LOOKUP_ITEM = BASE + "/item/nutrition/listExternal"
+    NOT_IDEMPOTENT = ("ORDER_INITIAL", "ORDER_INITIAL_CONFIRM", "ORDER_FINAL", "REGISTER")
 
-    def __init__(self, api_key:str, hash:str="MCDONALDS", market:str='US', application:str='MOT', language:str='en-US', platform:str='iphone', version:str='0.0.1.I', nonce:str='happybaby', verify_certificates:bool=True):
+    def __init__(self, api_key:str, hash:str="MCDONALDS", market:str='US', application:str='MOT', language:str='en-US', platform:str='iphone', version:str='0.0.1.I', nonce:str='happybaby', verify_certificates:bool=True, menu_cache:MenuCache=None, geocoder=None, zip_cache_size:int=1024, adapter=None, token_store:TokenStore=None, rate_limits:dict=None, retry:RetryPolicy=None, breaker:CircuitBreaker=None, observers:list=None, base:str=None, items_limit:int=10000, quote_cache:TTLCache=None, codec=None, template_limit:int=1024, budget:RequestBudget=None):
         self.api_key = api_key
         self.hash = hash
         self.market = market
@@ -33,27 +612,169 @@ class Client(object):
         self.version = version
         self.nonce = nonce
         self.verify_certificates = verify_certificates
+        self.menu_cache = menu_cache
+        self.geocoder = geocoder or TamuGeocoder(self.ZIP_LOOKUP)
+        for tamu in getattr(self.geocoder, "geocoders", (self.geocoder,)):
+            if isinstance(tamu, TamuGeocoder) and tamu.client is None:
+                tamu.client = self
+        self._geocode = functools.lru_cache(maxsize=zip_cache_size)(self.geocoder.lookup)
         self.username = None
         self.token = None
         self.zip_code = None
         self.store = None
-        self.items = {}
-        self.items_internal = {}
+        self.items = BoundedDict(items_limit)
+        self.items_internal = BoundedDict(items_limit)
         self.food = None
         self.food_price = -1
         self.card = None
         self.order_payment_id = -1
-        self.client = requests.Session()
-        self.client.verify = verify_certificates
-        if not verify_certificates:
-            urllib3.disable_warnings()
-        self.client.headers.update({'marketId': market, 'mcd_apikey': api_key})
         self.check_in_code = None
+        self.checkout = None
+        self.adapter = adapter
+        self.token_store = token_store
+        self.rate_limits = rate_limits or {}
+        self.retry = retry
+        self.breaker = breaker
+        self.budget = budget
+        self.observers = observers or []
+        self.quote_cache = quote_cache if quote_cache is not None else TTLCache(ttl=300)
+        self.codec = codec or get_codec()
+        self._templates = BoundedDict(template_limit)
+        if base:
+            # point every endpoint at another server, e.g. transport.StandInServer
+            for name in dir(Client):
+                url = getattr(Client, name)
+                if name.isupper() and isinstance(url, str) and url.startswith(Client.BASE):
+                    setattr(self, name, base + url[len(Client.BASE):])
+        self._password = None
+        self.client = self._create_session()
+
+    def _create_session(self):
+        # imported here so the command line starts fast
+        import requests, urllib3
+        session = requests.Session()
+        session.verify = self.verify_certificates
+        if not self.verify_certificates:
+            urllib3.disable_warnings()
+        session.headers.update({'marketId': self.market, 'mcd_apikey': self.api_key})
+        if self.adapter:
+            # lets many clients share one connection pool
+            session.mount("https://", self.adapter)
+            session.mount("http://", self.adapter)
+        return session
+
+    def _request(self, method:str, endpoint:str, *args, raw:bool=False, url:str=None, **kwargs):
+        '''
+        sends a request to one of the endpoints above, formatted with args,
+        or to url counted as that endpoint. signs in again and retries once
+        if a saved token has expired. every call is reported to the observers
+        '''
+        url = url or getattr(self, endpoint).format(*args)
+        start = time.perf_counter()
+        response = data = error = None
+        if kwargs.get("json") is not None:
+            kwargs["data"] = self.codec.dumps(kwargs.pop("json"))
+            kwargs["headers"] = {"Content-Type": "application/json"}
+        try:
+            response = self._send(method, endpoint, url, **kwargs)
+            if response.status_code == 401 and endpoint != "SIGN_IN" and self._password:
+                self._sign_in(self.username, self._password)
+                response = self._send(method, endpoint, url, **kwargs)
+            if raw:
+                return response
+            data = self.codec.loads(response.content)
+            return data
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if self.observers:
+                status = response.status_code if response is not None else None
+                size = 0
+                if response is not None:
+                    # streamed responses are not read here
+                    size = int(response.headers.get("Content-Length") or 0) if kwargs.get("stream") else len(response.content)
+                self._observe(endpoint, method, time.perf_counter() - start, status, size, data, error)
+
+    def _observe(self, endpoint:str, method:str, elapsed:float, status:int, size:int, data, error:Exception):
+        result_code = data.get("ResultCode") if isinstance(data, dict) else None
+        for observer in self.observers:
+            observer.record(endpoint, method, elapsed, status, size, result_code, error)
+
+    def _limiter(self, endpoint:str):
+        '''
+        rate limits are set per endpoint (MENU_CATEGORY) or family (MENU)
+        '''
+        return self.rate_limits.get(endpoint) or self.rate_limits.get(endpoint.split("_")[0])
+
+    def _retries(self, method:str, endpoint:str):
+        if self.retry and method.lower() == "get" and endpoint not in self.NOT_IDEMPOTENT:
+            return self.retry.attempts
+        return 0
+
+    def _send(self, method:str, endpoint:str, url:str, **kwargs):
+        '''
+        sends one request through the rate limiter and circuit breaker,
+        retrying idempotent requests that fail
+        '''
+        limiter = self._limiter(endpoint)
+        retries = self._retries(method, endpoint)
+        attempt = 0
+        while True:
+            if self.breaker:
+                self.breaker.check()
+            if limiter:
+                time.sleep(limiter.reserve())
+            if self.budget:
+                self.budget.take()
+            try:
+                response = self.client.request(method, url, **kwargs)
+            except OSError: # requests exceptions are OSErrors
+                if self.breaker:
+                    self.breaker.failure()
+                if attempt >= retries:
+                    raise
+                time.sleep(self.retry.delay(attempt))
+                attempt += 1
+                continue
+            if self.breaker:
+                if response.status_code >= 500:
+                    self.breaker.failure()
+                else:
+                    self.breaker.success()
+            if attempt < retries and response.status_code in self.retry.statuses:
+                time.sleep(self.retry.delay(attempt, response.headers.get("Retry-After")))
+                attempt += 1
+                continue
+            return response
+
     def sign_in(self, email: str, password: str):
         '''
-        signs into mcdonalds account and gets the login token
+        signs into mcdonalds account and gets the login token,
+        or reuses the token saved in the token_store
         '''
-        payload = {"marketId":self.market,
+        self._password = password
+        if self.token_store:
+            session = self.token_store.get(self.market, email)
+            if session:
+                self._resume(email, session)
+                return
+        self._sign_in(email, password)
+
+    def _sign_in(self, email:str, password:str):
+        response = self._request("post", "SIGN_IN", json=self._sign_in_payload(email, password))
+        self._check_for_error(response)
+        self._apply_sign_in(email, response)
+        if self.token_store:
+            self.token_store.put(self.market, email, self.token, self.zip_code)
+
+    def _resume(self, email:str, session):
+        self.username = email
+        self._set_token(session["token"])
+        self.zip_code = session["zip_code"]
+
+    def _sign_in_payload(self, email:str, password:str):
+        return {"marketId":self.market,
             "application":self.application,
             "languageName":self.language,
             "platform":self.platform,
@@ -65,19 +786,22 @@ class Client(object):
             "newPassword":None,
         }
 
-        response = self.client.post(self.SIGN_IN, json=payload).json()
-        self._check_for_error(response)
+    def _apply_sign_in(self, email:str, response):
         self.username = email
-        self.token = response["Data"]["AccessData"]["Token"]
+        self._set_token(response["Data"]["AccessData"]["Token"])
+        self.zip_code = response["Data"]["CustomerData"]["ZipCode"]
+
+    def _set_token(self, token:str):
+        self.token = token
         self.client.headers.update({"Token":self.token})
-        self.zip_code = response["Data"]["CustomerData"]["ZipCode"] 
+
     @staticmethod
     def _check_for_error(response):
         '''
         checks to make sure the error code is 1
         '''
         if response["ResultCode"] != 1:
-            raise McDonaldsError("error code {}".format(result_code))
+            raise McDonaldsError("error code {}".format(response["ResultCode"]))
 
     def _check_signed_in(f):
         def wrapper(self, *args, **kwargs):
@@ -130,7 +854,7 @@ class Client(object):
 			"subscribedToOffer": True,
 			"isActive": True
 		}
-        response = self.client.post(self.REGISTER, json=payload).json()
+        response = self._request("post", "REGISTER", json=payload)
         self._check_for_error(response)
     @staticmethod
     def _distance(lat1:float, lon1:float, lat2:float, lon2:float):
@@ -146,65 +870,123 @@ class Client(object):
         c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
         return radius * c
 
+    def _zip_request(self, url:str, params:dict):
+        # TamuGeocoder lookups, sent from the thread that called lookup_zip
+        return self._request("get", "ZIP_LOOKUP", url=url, params=params)
+
     def lookup_zip(self,zip_code:int=-1):
         '''
         looks up a coordinate from a zip code / account zip code
+        using the client geocoder, results are cached
         '''
-        if not zip_code:
+        if not zip_code or zip_code == -1:
             if not self.username:
                 raise McDonaldsError("Supply a zip code or sign in to use this method.")
             zip_code = self.zip_code
-        payload = {
-                "apikey":"demo",
-                "format":"json",
-                "version":"4.01",
-                "zip":zip_code
-        }
-        response = requests.get(self.ZIP_LOOKUP, params=payload).json()
-        geocode = response["OutputGeocodes"][0]["OutputGeocode"]
-        if geocode["Latitude"] == "0" and geocode["Longitude"] == "0":
-            raise McDonaldsError("geoservices.tamu.edu has banned your ip (apikey = demo).")
-        return geocode["Latitude"], geocode["Longitude"]
+        coordinates = self._geocode(str(zip_code))
+        if not coordinates:
+            raise McDonaldsError("Could not find zip code {}.".format(zip_code))
+        return coordinates
 
     @_check_signed_in
     def find_stores(self, latitude:str, longitude:str, range:int=8):
         '''
         finds stores near a latitude and longitude location
         '''
-        payload = {"filter":"search",
-                    "query":json.dumps({
-                        "generalStoreStatusCode":"OPEN",#,TEMPCLOSE,RENOVATION",
-                        "market":self.market,
-                        "storeAttributes":[],
-                        "pageSize":25,
-                        "local":self.language,
-                        "locationCriteria":{
-                            "distance":str(range),
-                            "longitude":longitude,
-                            "latitude":latitude
-                        }
-                    })
+        response = self._request("get", "STORES", params=self._stores_payload(latitude, longitude, range))
+        return self._parse_stores(response, latitude, longitude)
+
+    @_check_signed_in
+    def iter_stores(self, latitude:str, longitude:str, range:int=8, page_size:int=25, max_pages:int=None):
+        '''
+        yields every store near a location page by page, fetching the next
+        page in the background while the current one is used. stops when a
+        page is short or has no new stores
+        '''
+        seen = set()
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            page = 1
+            future = pool.submit(self._store_page, latitude, longitude, range, page_size, page)
+            while future:
+                stores = future.result()
+                page += 1
+                future = None
+                if len(stores) >= page_size and (not max_pages or page <= max_pages):
+                    future = pool.submit(self._store_page, latitude, longitude, range, page_size, page)
+                new = 0
+                for store in stores:
+                    if store.id not in seen:
+                        seen.add(store.id)
+                        new += 1
+                        yield store
+                if not new:
+                    break
+
+    def _store_page(self, latitude:str, longitude:str, range:int, page_size:int, page:int):
+        '''
+        fetches one page of stores, parsing each store as it is downloaded
+        '''
+        response = self._request("get", "STORES", params=self._stores_payload(latitude, longitude, range, page_size, page), raw=True, stream=True)
+        with response:
+            return [self._parse_store(store, latitude, longitude) for store in self._iter_array(response)]
+
+    @staticmethod
+    def _iter_array(response, chunk_size:int=16384):
+        '''
+        yields the items of a streamed json array one at a time
+        '''
+        parser = JsonArrayParser()
+        response.encoding = response.encoding or "utf-8"
+        for chunk in response.iter_content(chunk_size, decode_unicode=True):
+            yield from parser.feed(chunk)
+            if parser.done:
+                return
+        parser.close()
+
+    def _stores_payload(self, latitude:str, longitude:str, range:int, page_size:int=25, page:int=None):
+        query = {
+                "generalStoreStatusCode":"OPEN",#,TEMPCLOSE,RENOVATION",
+                "market":self.market,
+                "storeAttributes":[],
+                "pageSize":page_size,
+                "local":self.language,
+                "locationCriteria":{
+                    "distance":str(range),
+                    "longitude":longitude,
+                    "latitude":latitude
+                }
         }
-        response = self.client.get(self.STORES, params=payload).json()
-        data = []
-        for store in response:
-            store_lat = float(store["address"]["location"]["lat"])
-            store_long = float(store["address"]["location"]["lon"])
-            data.append({
-                "status":store["generalStatus"]['status'],
-                "address":"{}, {}, {} {}".format(store["address"]["addressLine1"], store["address"]["cityTown"], store["address"]["subdivision"],
-                    store["address"]["postalZip"]),
-                "coordinates": {"latitude":store_lat, "longitude":store_long},
-                "id":store["identifiers"]["storeIdentifier"][1]["identifierValue"],
-                "distance":self._distance(float(latitude),float(longitude),store_lat,store_long),
-                "phone":store["storeNumbers"]["phonenumber"][0]["number"]
-            })
-        return data
+        if page:
+            query["pageNumber"] = page
+        return {"filter":"search", "query":json.dumps(query)}
+
+    def _parse_stores(self, response, latitude:str, longitude:str):
+        return [self._parse_store(store, latitude, longitude) for store in response]
+
+    def _parse_store(self, store, latitude:str, longitude:str):
+        store_lat = float(store["address"]["location"]["lat"])
+        store_long = float(store["address"]["location"]["lon"])
+        return Store(
+            status=store["generalStatus"]['status'],
+            address="{}, {}, {} {}".format(store["address"]["addressLine1"], store["address"]["cityTown"], store["address"]["subdivision"],
+                store["address"]["postalZip"]),
+            latitude=store_lat,
+            longitude=store_long,
+            id=store["identifiers"]["storeIdentifier"][1]["identifierValue"],
+            distance=self._distance(float(latitude),float(longitude),store_lat,store_long),
+            phone=store["storeNumbers"]["phonenumber"][0]["number"]
+        )
+
     @_check_signed_in
     def offers(self,store=None, coords:list=None):
         '''
         finds offers for a store or by a coordinate
         '''
+        response = self._request("get", "OFFERS", params=self._offers_payload(store, coords))
+        self._check_for_error(response)
+        return [Offer(offer) for offer in response["Data"]]
+
+    def _offers_payload(self, store=None, coords:list=None):
         payload = {"application":self.application,
                 "languageName": self.language,
                 "marketId": self.market,
@@ -218,58 +1000,145 @@ class Client(object):
             payload["storeId"] = [store["id"]]
             payload["latitude"] = store["coordinates"]["latitude"]
             payload["longitude"] = store["coordinates"]["longitude"]
-
-        response = self.client.get(self.OFFERS, params=payload).json()
-        self._check_for_error(response)
-        return response["Data"]
+        return payload
 
     @_check_signed_in
-    def menu(self, store,show_promotions:bool=False, lookup_promo_bases:bool=False):
+    def menu(self, store,show_promotions:bool=False, lookup_promo_bases:bool=False, workers:int=1):
         '''
         creates the store menu by going through each category,
-        and removing the store outages
+        and removing the store outages. with workers > 1 the category
+        details and promo base lookups are fetched in parallel. with a
+        menu_cache only the store outages are fetched once the catalog is cached
         '''
         self.store = store
-        store_payload = {
+        missing_products = self.store_outages(store)
+        catalog = self.menu_catalog(show_promotions, lookup_promo_bases, workers)
+        return self._apply_outages(catalog, missing_products)
+
+    @_check_signed_in
+    def store_outages(self, store):
+        '''
+        returns the product codes a store is out of
+        '''
+        response = self._request("get", "STORE_INFO", params=self._store_info_payload(store))
+        self._check_for_error(response)
+        return response["Data"]["OutageProductCodes"]
+
+    @_check_signed_in
+    def menu_catalog(self, show_promotions:bool=False, lookup_promo_bases:bool=False, workers:int=1):
+        '''
+        returns the store independent part of the menu as a list of
+        [category, [[name, id], ...]], from the menu_cache if there is one
+        '''
+        key = self._menu_key(show_promotions, lookup_promo_bases)
+        catalog = self.menu_cache.get(key) if self.menu_cache else None
+        if catalog is None:
+            catalog = self._fetch_catalog(show_promotions, lookup_promo_bases, workers)
+            if self.menu_cache:
+                self.menu_cache.put(key, catalog)
+        return catalog
+
+    def _menu_key(self, show_promotions:bool, lookup_promo_bases:bool):
+        return (self.market, self.language, show_promotions, lookup_promo_bases)
+
+    def _fetch_catalog(self, show_promotions:bool, lookup_promo_bases:bool, workers:int=1):
+        '''
+        fetches the menu categories, which do not depend on the store
+        '''
+        base_payload = self._menu_payload()
+        response = self._request("get", "MENU_CATEGORIES", params={**base_payload, **{"categoryType":1}})
+        ids = [category["category_id"] for category in response["categories"]["category"]]
+        categories = self._map(lambda id: self._request("get", "MENU_CATEGORY", params={**base_payload, **{"categoryId":id}}), ids, workers)
+        bases = {}
+        if lookup_promo_bases:
+            promos = self._promo_items(categories)
+            names = self.lookup_items([promo.split("-")[0] for promo in promos], workers=workers)
+            bases = self._base_items(promos, names)
+        return self._build_catalog(categories, show_promotions, bases)
+
+    @staticmethod
+    def _map(f, iterable, workers:int=1):
+        '''
+        map that keeps the input order, using a thread pool when workers > 1
+        '''
+        if workers <= 1:
+            return list(map(f, iterable))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(f, iterable))
+
+    @staticmethod
+    def _promo_items(categories):
+        '''
+        promotional items ending in a -XXX code, in menu order
+        '''
+        promos = []
+        for response in categories:
+            for item in response["category"]["items"]["item"]:
+                if item["do_not_show"] == "Promotional" and "-" in item["external_id"] and item["external_id"] not in promos:
+                    promos.append(item["external_id"])
+        return promos
+
+    @staticmethod
+    def _build_catalog(categories, show_promotions:bool, bases):
+        '''
+        builds a list of [category, [[name, id], ...]] from the category
+        detail responses, bases maps promotional items to the (name, base)
+        found by _base_items
+        '''
+        catalog = []
+        for response in categories:
+            entries = []
+            for item in response["category"]["items"]["item"]:
+                if item["do_not_show"] == "Core" or show_promotions:
+                    entries.append([item["item_name"], item["external_id"]])
+                if item["external_id"] in bases:
+                    name, base = bases[item["external_id"]]
+                    if name:
+                        entries.append([name, base])
+            catalog.append([response["category"]["category_name"], entries])
+        return catalog
+
+    def _apply_outages(self, catalog, missing_products):
+        '''
+        turns a catalog into the store menu by removing the store outages
+        '''
+        missing_products = set(missing_products)
+        data = {}
+        for category, entries in catalog:
+            data[category] = {}
+            for name, id in entries:
+                if id not in missing_products:
+                    data[category][name] = id
+                    self.items[id] = name
+        return Menu((category, entries.items()) for category, entries in data.items())
+
+    def _store_info_payload(self, store):
+        return {
                 "application":self.application,
                 "languageName":self.language,
                 "marketId":self.market,
                 "platform":self.platform,
                 "storeNumber":store["id"]
         }
-        response = self.client.get(self.STORE_INFO, params=store_payload).json()
-        self._check_for_error(response)
-        missing_products = response["Data"]["OutageProductCodes"]
 
-        base_payload = {
+    def _menu_payload(self):
+        return {
                 "country":self.market,
                 "language":self.language[:2],
                 "languageName":self.language,
                 "showLiveData":1
         }
-        response = self.client.get(self.MENU_CATEGORIES, params={**base_payload, **{"categoryType":1}}).json()
-        ids = [category["category_id"] for category in response["categories"]["category"]]
-        data = {}
-        for id in ids:
-            response = self.client.get(self.MENU_CATEGORY, params={**base_payload, **{"categoryId":id}}).json()
-            category = response["category"]["category_name"]
-            data[category] = {}
-            for item in response["category"]["items"]["item"]:
-                if item["external_id"] not in missing_products and (item["do_not_show"] == "Core" or show_promotions):
-                    data[category][item["item_name"]] = item["external_id"]
-                    self.items[item["external_id"]] = item["item_name"]
-                if item["do_not_show"] == "Promotional" and "-" in item["external_id"] and lookup_promo_bases:
-                    name, base = self._get_base_item(item["external_id"])
-                    if name and base not in missing_products:
-                        self.items[base] = name
-                        data[category][name] = base
-        return data
-    def _get_base_item(self, item):
-        '''
-        returns the base item, if any for a promotional item ending in a -XXX code
-        '''
-        base = item.split("-")[0]
-        return self.lookup_item(int(base)), base
+
+    @staticmethod
+    def _base_items(promos, names):
+        '''
+        maps promotional items to their (name, base) given the looked up base names
+        '''
+        bases = {}
+        for promo in promos:
+            base = promo.split("-")[0]
+            bases[promo] = names.get(base), base
+        return bases
 
     @_check_signed_in
     def promotion_picker(self, lookup_items:bool=False, all_deals:bool=False, min_products:int=0,lookup_promo:bool=False):
@@ -277,12 +1146,21 @@ class Client(object):
         picks promotions using the users offers
         '''
         offers = self.offers(store=self.store)
+        return self._promotion_prompt(offers, self.lookup_items, lookup_items, all_deals, min_products, lookup_promo)
+
+    def _promotion_prompt(self, offers, lookup, lookup_items:bool=False, all_deals:bool=False, min_products:int=0, lookup_promo:bool=False):
+        '''
+        the interactive part of promotion_picker, lookup is lookup_items
+        '''
         for i, offer in enumerate(offers):
             if offer["Id"] < 0 or all_deals:
                 print("[{}] {} ({})".format(i+1, offer["Name"], offer["Id"]))
         offer_id = int(input("Offer # > "))
         offer = offers[offer_id-1]
         promotion = {"id":offer["Id"], "type":0, "parts":[]}
+        unknown = [item for product in offer["ProductSets"] if not product["AnyProduct"] and (lookup_items or len(product["Products"]) <= min_products)
+                for item in product["Products"] if item not in self.items]
+        names = lookup(unknown, promotions=lookup_promo) if unknown else {}
         for product in offer["ProductSets"]:
             try:
                 promotion['type'] = product["Action"]["DiscountType"]
@@ -293,16 +1171,10 @@ class Client(object):
                 item_id = int(input("Pick any product id > "))
             else:
                 for i, item in enumerate(product["Products"]):
-                    try:
+                    if item in self.items:
                         print("[{}] {} ({})".format(i+1, self.items[item], item))
-                    except KeyError:
-                        if lookup_items or len(product["Products"]) <= min_products:
-                            try:
-                                name = self.lookup_item(item,promotions=lookup_promo)
-                                if name:
-                                    print("[{}] {} ({})".format(i+1, name, item))
-                            except KeyError:
-                                pass
+                    elif names.get(str(item)):
+                        print("[{}] {} ({})".format(i+1, names[str(item)], item))
 
             if not product["Alias"]:
                 print("Item to buy for promotion")
@@ -314,13 +1186,42 @@ class Client(object):
         return promotion
     def lookup_item(self, item:int, promotions=False):
         # https://api.mcd.com/v3/items/nutrition/listExternal?country=US&externalItemId=1&externalItemId=2&language=en&languageName=en-US
-        payload = {
+        response = self._request("get", "LOOKUP_ITEM", params=self._lookup_payload(item))
+        return self._parse_lookup(response, promotions)
+
+    def lookup_items(self, items:list, promotions=False, chunk_size:int=25, workers:int=1):
+        '''
+        looks up many external item ids at once, sending chunk_size ids per
+        request. returns a dict of external id -> item name for the ids found
+        '''
+        items = list(dict.fromkeys(str(item) for item in items))
+        chunks = [items[i:i+chunk_size] for i in range(0, len(items), chunk_size)]
+        responses = self._map(lambda chunk: self._request("get", "LOOKUP_ITEM", params=self._lookup_payload(chunk)), chunks, workers)
+        return self._parse_lookups(responses, promotions)
+
+    def _lookup_payload(self, items:list):
+        return {
                 "country": self.market,
                 "language": self.language[:2],
                 "languageName": self.language,
-                "externalItemId": item
+                "externalItemId": items
         }
-        response = self.client.get(self.LOOKUP_ITEM, params=payload).json()
+
+    @staticmethod
+    def _parse_lookups(responses, promotions=False):
+        names = {}
+        for response in responses:
+            if "error" in response:
+                continue
+            found = response["items"]["item"]
+            # a single match comes back as an object instead of a list
+            for item in (found if isinstance(found, list) else [found]):
+                if item["do_not_show"] == "Core" or promotions:
+                    names[str(item["external_id"])] = item["item_name"]
+        return names
+
+    @staticmethod
+    def _parse_lookup(response, promotions=False):
         if "error" in response:
             return None
         elif response["items"]["item"]["do_not_show"] == "Core" or promotions:
@@ -331,7 +1232,15 @@ class Client(object):
         '''
         the main order picker, incorporating the promotion picker
         '''
+        return self._order_prompt(menu, lambda: self.promotion_picker(lookup_items=promo_lookup_items, all_deals=promo_all_deals,
+                min_products=promo_min_products, lookup_promo=promo_lookup_promo))
+
+    def _order_prompt(self, menu, pick_promotion):
+        '''
+        the interactive part of order_picker, pick_promotion returns one deal
+        '''
         items = {"normal":[], "deals":[]}
+        menu = dict(menu)
         menu["Promotions"] = "Promotions"
         while True:
             for i, category in enumerate(menu.keys()):
@@ -339,7 +1248,7 @@ class Client(object):
             category_id = int(input("Category number > "))
             menu_category = menu[list(menu.keys())[category_id-1]]
             if menu_category == "Promotions":
-                items["deals"].append(self.promotion_picker(lookup_items=promo_lookup_items, all_deals=promo_all_deals, min_products=promo_min_products,lookup_promo=promo_lookup_promo))
+                items["deals"].append(pick_promotion())
                 del menu["Promotions"] # only 1 promotion per order
                 if input("done [Y/n] > ").lower() == "y":
                     break
@@ -368,68 +1277,81 @@ class Client(object):
         '''
         self.food = food
         payload = self._generate_json(food)
-        response = self.client.post(self.ORDER_TOTAL, json=payload).json()
+        response = self._request("post", "ORDER_TOTAL", json=payload)
         self._check_for_error(response)
         self.food_price = response['Data']['OrderView']['TotalValue']
         return response['Data']['OrderView']['TotalValue']
 
-    def _generate_json(self, raw_order, card=None):
+    @_check_signed_in
+    def quote_many(self, orders:list, store, workers:int=8):
         '''
-        generates the json for ordering, picking up or checking the prices for an order
+        returns the totals for many orders at a store, pricing them in
+        parallel. equivalent orders are only priced once and totals are
+        cached for quote_cache.ttl seconds
         '''
-        base = {
-        "userName": self.username,
-        "languageName": self.language,
-        "platform": self.platform,
-        "marketId": self.market,
-        "isNormalOrder": False,
-        "storeId": self.store["id"],
-        "application": self.application,
-        "options": ["ApplyPromotion"],
-        "orderView": {}
-        }
-        normal_product_json = []
-        for item in raw_order["normal"]:
-            item_json = {
-                    "Choices": [],
-                    "ProductCode": item["id"],
-                    "Customizations": [],
-                    "Quantity": item["quantity"]
-            }
-            normal_product_json.append(item_json)
-        promotional_product_json = []
-        for item in raw_order["deals"]:
-            item_json = {
-			"Id": item["id"],
-			"Type": item["type"],
-            "ProductSets": []
-            }
-            for part in item["parts"]:
-                part_json = {
-                        "Alias": part["alias"],
-                        "Products": [{
-                            "Choices": [],
-                            "ProductCode": part["id"],
-                            "Customizations": [],
-                            "Quantity": 1,
-                        }],
-                        "Quantity": 1
-                }
-                item_json["ProductSets"].append(part_json)
-            promotional_product_json.append(item_json)
-            
-
-		
-        order_view = {
-            "Market": self.market,
-            "LanguageName": self.language,
-            "NickName": "",
-            "StoreID": self.store["id"],
-            "Products": normal_product_json,
-            "UserName": self.username,
-            "PriceType": 2,
-            "PromotionListView": promotional_product_json
-        }
+        keys = [self._quote_key(order, store) for order in orders]
+        totals = {}
+        missing = {}
+        for key, order in zip(keys, orders):
+            if key in totals or key in missing:
+                continue
+            total = self.quote_cache.get(key)
+            if total is None:
+                missing[key] = order
+            else:
+                totals[key] = total
+        quoted = self._map(lambda order: self._quote(order, store), list(missing.values()), workers)
+        for key, total in zip(missing, quoted):
+            self.quote_cache.put(key, total)
+            totals[key] = total
+        return [totals[key] for key in keys]
+
+    def _quote(self, order, store):
+        response = self._request("post", "ORDER_TOTAL", json=self._generate_json(order, store=store))
+        self._check_for_error(response)
+        return response['Data']['OrderView']['TotalValue']
+
+    def _quote_key(self, order, store):
+        '''
+        hash of everything that changes the price of an order, with the
+        products merged and sorted so equivalent orders hash the same
+        '''
+        normal = {}
+        for item in order["normal"]:
+            normal[int(item["id"])] = normal.get(int(item["id"]), 0) + item["quantity"]
+        deals = sorted([int(deal["id"]), deal["type"], sorted([int(part["id"]), part["alias"] or ""] for part in deal["parts"])]
+                for deal in order["deals"])
+        view = [self.market, self.language, self.username, store["id"], sorted(normal.items()), deals]
+        return hashlib.sha1(json.dumps(view).encode()).hexdigest()
+
+    def _generate_json(self, raw_order, card=None, store=None):
+        '''
+        generates the json for ordering, picking up or checking the prices for an order.
+        only the product lines and payment are added to a copy of the store template
+        '''
+        store = store or self.store
+        template = self._order_template(store)
+        order_view = dict(template["orderView"])
+        order_view["Products"] = [{
+                "Choices": [],
+                "ProductCode": item["id"],
+                "Customizations": [],
+                "Quantity": item["quantity"]
+        } for item in raw_order["normal"]]
+        order_view["PromotionListView"] = [{
+                "Id": item["id"],
+                "Type": item["type"],
+                "ProductSets": [{
+                    "Alias": part["alias"],
+                    "Products": [{
+                        "Choices": [],
+                        "ProductCode": part["id"],
+                        "Customizations": [],
+                        "Quantity": 1,
+                    }],
+                    "Quantity": 1
+                } for part in item["parts"]]
+        } for item in raw_order["deals"]]
         if card:
             order_view["Payment"] = {
                 "POD": 0,
@@ -438,9 +1360,42 @@ class Client(object):
                 "PaymentDataId": -1,
                 "PaymentMethodId": card["PaymentMethodId"]
             }
+        base = dict(template)
+        base["options"] = list(template["options"]) # the only list shared with the template
         base["orderView"] = order_view
         return base
 
+    def _order_template(self, store):
+        '''
+        the parts of the order json that only depend on the account and store,
+        built once per store
+        '''
+        key = (self.username, store["id"])
+        template = self._templates.get(key)
+        if template is None:
+            template = {
+            "userName": self.username,
+            "languageName": self.language,
+            "platform": self.platform,
+            "marketId": self.market,
+            "isNormalOrder": False,
+            "storeId": store["id"],
+            "application": self.application,
+            "options": ["ApplyPromotion"],
+            "orderView": {
+                "Market": self.market,
+                "LanguageName": self.language,
+                "NickName": "",
+                "StoreID": store["id"],
+                "Products": [],
+                "UserName": self.username,
+                "PriceType": 2,
+                "PromotionListView": []
+            }
+            }
+            self._templates[key] = template
+        return template
+
     @_check_signed_in
     def order(self, card, food=None, store=None):
         '''
@@ -451,11 +1406,11 @@ class Client(object):
         if store:
             self.store = store
         self.card = card
-        payload = self._generate_json(self.food, card=card)
-        response = self.client.post(self.ORDER_INITIAL, json=payload).json()
-        self.order_payment_id = response['OrderView']['OrderPaymentId']
-        self.food_price = response['OrderView']['TotalValue']
-        self.check_in_code = response["OrderView"]["CheckInCode"]
+        self.checkout = Checkout(self, card, self.food, self.store)
+        self.checkout.place()
+        self.order_payment_id = self.checkout.order_payment_id
+        self.food_price = self.checkout.total
+        self.check_in_code = self.checkout.check_in_code
 
     
     @_check_signed_in
@@ -464,73 +1419,79 @@ class Client(object):
         CHARGES PAYMENT METHOD
         Allows food for pickup and returns the order number.
         '''
-        self._get_order_pickup()
-        payload = {
+        if self.checkout is None:
+            raise McDonaldsError('You must order before picking up.')
+        return self.checkout.run()
+
+    def _confirm_payload(self, store):
+        return {
                 "marketId": self.market,
                 "languageName": self.language,
-                "POSStoreNumber":self.store["id"],
+                "POSStoreNumber":store["id"],
                 "application": self.application,
                 "platform": self.platform
         }
 
-        response = self.client.post(self.ORDER_INITIAL_CONFIRM.format(self.check_in_code), json=payload).json()
-        self._get_order_pickup()
-        payload = {
+    def _final_payload(self, order_payment_id, card, store):
+        return {
                 "OrderPayment": {
                     "PaymentMethodId": 3,
-                    "OrderPaymentId": self.order_payment_id,
-                    "CustomerPaymentMethodId": self.card["CustomerPaymentMethodId"],
+                    "OrderPaymentId": order_payment_id,
+                    "CustomerPaymentMethodId": card["CustomerPaymentMethodId"],
                     "POD": 0
                 },
                 "languageName": self.language,
                 "platform": self.platform,
                 "marketId": self.market,
-                "POSStoreNumber": self.store["id"],
+                "POSStoreNumber": store["id"],
                 "AdditionalPayments": [],
                 "PriceType": 2,
                 "checkInData": "0",
                 "application": self.application
-
-
         }
-        response = self.client.post(self.ORDER_FINAL.format(self.check_in_code), json=payload).json()
-        return response["OrderNumber"]
-        
-    def _get_order_pickup(self):
+
+    def _get_order_pickup(self, check_in_code):
         '''
         idk what this does, just that mcdonalds does it
         '''
-        payload = {
+        self._request("get", "ORDER_PICKUP", check_in_code, params=self._pickup_payload(), raw=True)
+
+    def _pickup_payload(self):
+        return {
                 "application": self.application,
                 "languageName": self.language,
                 "marketId": self.market,
                 "platform": self.platform
         }
 
-        self.client.get(self.ORDER_PICKUP.format(self.check_in_code), params=payload)
-
     @_check_signed_in
     def cards(self):
         '''
         returns raw json for the cards that a user has on file
         '''
-        payload = {
+        response = self._request("get", "PROFILE", params=self._cards_payload())
+        self._check_for_error(response)
+        return response['Data']['PaymentCard']
+
+    def _cards_payload(self):
+        return {
                 "application":self.application,
                 "languageName": self.language,
                 "marketId": self.market,
                 "platform":self.platform,
                 "userName":self.username
         }
-        response = self.client.get(self.PROFILE, params=payload).json()
-        self._check_for_error(response)
-        return response['Data']['PaymentCard']
 
 if __name__ == '__main__':
-    if len(sys.argv) != 4:
-        print("usage: mcdonald.py API_KEY USERNAME PASSWORD")
-        exit()
-    client = Client(sys.argv[1])
-    client.sign_in(sys.argv[2], sys.argv[3])
+    import argparse
+    parser = argparse.ArgumentParser(description="Order mcdonalds from the command line.")
+    parser.add_argument("api_key")
+    parser.add_argument("username")
+    parser.add_argument("password")
+    parser.add_argument("--token-store", help="file to save the sign in token in, so later runs skip signing in")
+    args = parser.parse_args()
+    client = Client(args.api_key, token_store=TokenStore(args.token_store) if args.token_store else None)
+    client.sign_in(args.username, args.password)
     stores = client.find_stores(*client.lookup_zip())
     menu = client.menu(stores[0], lookup_promo_bases=True)
     items = client.order_picker(menu)
@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+import asyncio, codecs, time
+import aiohttp
+from mcdonald import Checkout, Client, JsonArrayParser, McDonaldsError
+from models import Offer
+
+
+class AsyncClient(Client):
+    '''
+    asyncio version of Client, every network method is a coroutine.
+    pass the same connector to many clients to share one connection pool.
+    '''
+    def __init__(self, api_key:str, connector:aiohttp.BaseConnector=None, limit:int=100, **kwargs):
+        self.connector = connector
+        self.owns_connector = False
+        self.limit = limit
+        self.headers = {}
+        self._loop = None
+        super().__init__(api_key, **kwargs)
+
+    def _create_session(self):
+        # aiohttp sessions have to be created inside a running loop, see _session
+        self.headers = {'marketId': self.market, 'mcd_apikey': self.api_key}
+        return None
+
+    def _session(self):
+        if self.client is None or self.client.closed:
+            if self.connector is None or self.connector.closed:
+                self.connector = aiohttp.TCPConnector(limit=self.limit, ssl=None if self.verify_certificates else False)
+                self.owns_connector = True
+            self.client = aiohttp.ClientSession(connector=self.connector, connector_owner=False)
+        return self.client
+
+    async def close(self):
+        '''
+        closes the session, the connector is left open if it was passed in
+        '''
+        if self.client is not None:
+            await self.client.close()
+        if self.owns_connector and self.connector is not None:
+            await self.connector.close()
+            self.connector = None
+            self.owns_connector = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    @staticmethod
+    def _params(payload):
+        # aiohttp only takes flat str params, requests expands lists into repeated keys
+        params = []
+        for key, value in payload.items():
+            for v in (value if isinstance(value, (list, tuple)) else [value]):
+                params.append((key, str(v)))
+        return params
+
+    async def _request(self, method:str, endpoint:str, *args, params=None, json=None, raw:bool=False, url:str=None, stream:bool=False):
+        '''
+        sends a request to one of the endpoints, formatted with args, or to
+        url counted as that endpoint. signs in again and retries once if a
+        saved token has expired. every call is reported to the observers.
+        with stream the body is left unread and the caller releases the response
+        '''
+        url = url or getattr(self, endpoint).format(*args)
+        start = time.perf_counter()
+        response = data = error = None
+        body = b""
+        try:
+            payload = None if json is None else self.codec.dumps(json)
+            response, body = await self._send(method, endpoint, url, stream, params=self._params(params or {}), data=payload)
+            if response.status == 401 and endpoint != "SIGN_IN" and self._password:
+                response.release()
+                await self._sign_in(self.username, self._password)
+                response, body = await self._send(method, endpoint, url, stream, params=self._params(params or {}), data=payload)
+            if raw:
+                return response
+            data = self.codec.loads(body)
+            return data
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if self.observers:
+                status = response.status if response is not None else None
+                # streamed responses are not read here
+                size = int(response.headers.get("Content-Length") or 0) if stream and response is not None else len(body)
+                self._observe(endpoint, method, time.perf_counter() - start, status, size, data, error)
+
+    async def _send(self, method:str, endpoint:str, url:str, stream:bool=False, **kwargs):
+        '''
+        sends one request through the rate limiter and circuit breaker,
+        retrying idempotent requests that fail. returns the response and its
+        body, which is left unread with stream
+        '''
+        limiter = self._limiter(endpoint)
+        retries = self._retries(method, endpoint)
+        attempt = 0
+        while True:
+            if self.breaker:
+                self.breaker.check()
+            if limiter:
+                await asyncio.sleep(limiter.reserve())
+            if self.budget:
+                self.budget.take()
+            try:
+                headers = self.headers if kwargs.get("data") is None else {**self.headers, "Content-Type": "application/json"}
+                response = await self._session().request(method, url, headers=headers, **kwargs)
+                body = b""
+                if not stream:
+                    async with response:
+                        body = await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if self.breaker:
+                    self.breaker.failure()
+                if attempt >= retries:
+                    raise
+                await asyncio.sleep(self.retry.delay(attempt))
+                attempt += 1
+                continue
+            if self.breaker:
+                if response.status >= 500:
+                    self.breaker.failure()
+                else:
+                    self.breaker.success()
+            if attempt < retries and response.status in self.retry.statuses:
+                response.release()
+                await asyncio.sleep(self.retry.delay(attempt, response.headers.get("Retry-After")))
+                attempt += 1
+                continue
+            return response, body
+
+    async def sign_in(self, email:str, password:str):
+        '''
+        signs into mcdonalds account and gets the login token,
+        or reuses the token saved in the token_store
+        '''
+        self._password = password
+        if self.token_store:
+            session = self.token_store.get(self.market, email)
+            if session:
+                self._resume(email, session)
+                return
+        await self._sign_in(email, password)
+
+    async def _sign_in(self, email:str, password:str):
+        response = await self._request("post", "SIGN_IN", json=self._sign_in_payload(email, password))
+        self._check_for_error(response)
+        self._apply_sign_in(email, response)
+        if self.token_store:
+            self.token_store.put(self.market, email, self.token, self.zip_code)
+
+    def _set_token(self, token:str):
+        self.token = token
+        self.headers["Token"] = self.token
+
+    async def lookup_zip(self, zip_code:int=-1):
+        '''
+        Client.lookup_zip run in a thread, the geocoders are blocking
+        '''
+        self._loop = asyncio.get_running_loop()
+        return await self._loop.run_in_executor(None, Client.lookup_zip, self, zip_code)
+
+    def _zip_request(self, url:str, params:dict):
+        # called from the lookup_zip thread, the request itself runs on the loop
+        return self._blocking(self._request, self._loop)("get", "ZIP_LOOKUP", url=url, params=params)
+
+    @Client._check_signed_in
+    async def find_stores(self, latitude:str, longitude:str, range:int=8):
+        '''
+        finds stores near a latitude and longitude location
+        '''
+        response = await self._request("get", "STORES", params=self._stores_payload(latitude, longitude, range))
+        return self._parse_stores(response, latitude, longitude)
+
+    @Client._check_signed_in
+    async def iter_stores(self, latitude:str, longitude:str, range:int=8, page_size:int=25, max_pages:int=None):
+        '''
+        yields every store near a location page by page, fetching the next
+        page while the current one is used
+        '''
+        seen = set()
+        page = 1
+        task = asyncio.ensure_future(self._store_page(latitude, longitude, range, page_size, page))
+        try:
+            while task:
+                stores = await task
+                page += 1
+                task = None
+                if len(stores) >= page_size and (not max_pages or page <= max_pages):
+                    task = asyncio.ensure_future(self._store_page(latitude, longitude, range, page_size, page))
+                new = 0
+                for store in stores:
+                    if store.id not in seen:
+                        seen.add(store.id)
+                        new += 1
+                        yield store
+                if not new:
+                    break
+        finally:
+            if task:
+                task.cancel()
+
+    async def _store_page(self, latitude:str, longitude:str, range:int, page_size:int, page:int):
+        '''
+        fetches one page of stores, parsing each store as it is downloaded
+        '''
+        response = await self._request("get", "STORES", params=self._stores_payload(latitude, longitude, range, page_size, page), raw=True, stream=True)
+        try:
+            return [self._parse_store(store, latitude, longitude) async for store in self._iter_array(response)]
+        finally:
+            response.release()
+
+    @staticmethod
+    async def _iter_array(response, chunk_size:int=16384):
+        '''
+        yields the items of a streamed json array one at a time
+        '''
+        parser = JsonArrayParser()
+        decoder = codecs.getincrementaldecoder(response.charset or "utf-8")()
+        async for chunk in response.content.iter_chunked(chunk_size):
+            for item in parser.feed(decoder.decode(chunk)):
+                yield item
+            if parser.done:
+                return
+        for item in parser.feed(decoder.decode(b"", final=True)):
+            yield item
+        parser.close()
+
+    @Client._check_signed_in
+    async def offers(self, store=None, coords:list=None):
+        '''
+        finds offers for a store or by a coordinate
+        '''
+        response = await self._request("get", "OFFERS", params=self._offers_payload(store, coords))
+        self._check_for_error(response)
+        return [Offer(offer) for offer in response["Data"]]
+
+    @Client._check_signed_in
+    async def menu(self, store, show_promotions:bool=False, lookup_promo_bases:bool=False, workers:int=1):
+        '''
+        creates the store menu by going through each category,
+        and removing the store outages. with workers > 1 up to that many
+        category details and promo base lookups are in flight at once.
+        with a menu_cache only the store outages are fetched once cached
+        '''
+        self.store = store
+        missing_products = await self.store_outages(store)
+        catalog = await self.menu_catalog(show_promotions, lookup_promo_bases, workers)
+        return self._apply_outages(catalog, missing_products)
+
+    @Client._check_signed_in
+    async def store_outages(self, store):
+        '''
+        returns the product codes a store is out of
+        '''
+        response = await self._request("get", "STORE_INFO", params=self._store_info_payload(store))
+        self._check_for_error(response)
+        return response["Data"]["OutageProductCodes"]
+
+    @Client._check_signed_in
+    async def menu_catalog(self, show_promotions:bool=False, lookup_promo_bases:bool=False, workers:int=1):
+        '''
+        returns the store independent part of the menu, from the menu_cache if there is one
+        '''
+        key = self._menu_key(show_promotions, lookup_promo_bases)
+        catalog = self.menu_cache.get(key) if self.menu_cache else None
+        if catalog is None:
+            catalog = await self._fetch_catalog(show_promotions, lookup_promo_bases, workers)
+            if self.menu_cache:
+                self.menu_cache.put(key, catalog)
+        return catalog
+
+    async def _fetch_catalog(self, show_promotions:bool, lookup_promo_bases:bool, workers:int=1):
+        base_payload = self._menu_payload()
+        response = await self._request("get", "MENU_CATEGORIES", params={**base_payload, **{"categoryType":1}})
+        ids = [category["category_id"] for category in response["categories"]["category"]]
+        categories = await self._map(lambda id: self._request("get", "MENU_CATEGORY", params={**base_payload, **{"categoryId":id}}), ids, workers)
+        bases = {}
+        if lookup_promo_bases:
+            promos = self._promo_items(categories)
+            names = await self.lookup_items([promo.split("-")[0] for promo in promos], workers=workers)
+            bases = self._base_items(promos, names)
+        return self._build_catalog(categories, show_promotions, bases)
+
+    @staticmethod
+    async def _map(f, iterable, workers:int=1):
+        '''
+        awaits f for every item keeping the input order, at most workers at a time
+        '''
+        semaphore = asyncio.Semaphore(max(workers, 1))
+        async def run(item):
+            async with semaphore:
+                return await f(item)
+        return await asyncio.gather(*[run(item) for item in iterable])
+
+    async def lookup_item(self, item:int, promotions=False):
+        response = await self._request("get", "LOOKUP_ITEM", params=self._lookup_payload(item))
+        return self._parse_lookup(response, promotions)
+
+    async def lookup_items(self, items:list, promotions=False, chunk_size:int=25, workers:int=1):
+        '''
+        looks up many external item ids at once, sending chunk_size ids per
+        request. returns a dict of external id -> item name for the ids found
+        '''
+        items = list(dict.fromkeys(str(item) for item in items))
+        chunks = [items[i:i+chunk_size] for i in range(0, len(items), chunk_size)]
+        responses = await self._map(lambda chunk: self._request("get", "LOOKUP_ITEM", params=self._lookup_payload(chunk)), chunks, workers)
+        return self._parse_lookups(responses, promotions)
+
+    @Client._check_signed_in
+    async def promotion_picker(self, lookup_items:bool=False, all_deals:bool=False, min_products:int=0, lookup_promo:bool=False):
+        '''
+        picks promotions using the users offers, prompting in a thread so the loop keeps running
+        '''
+        loop = asyncio.get_running_loop()
+        offers = await self.offers(store=self.store)
+        return await loop.run_in_executor(None, self._promotion_prompt, offers, self._blocking(self.lookup_items, loop),
+                lookup_items, all_deals, min_products, lookup_promo)
+
+    @Client._check_signed_in
+    async def order_picker(self, menu, promo_lookup_items:bool=False, promo_all_deals:bool=False, promo_min_products:int=0, promo_lookup_promo:bool=False):
+        '''
+        the main order picker, prompting in a thread so the loop keeps running
+        '''
+        loop = asyncio.get_running_loop()
+        offers = self._blocking(self.offers, loop)
+        def pick_promotion():
+            return self._promotion_prompt(offers(store=self.store), self._blocking(self.lookup_items, loop), promo_lookup_items,
+                    promo_all_deals, promo_min_products, promo_lookup_promo)
+        return await loop.run_in_executor(None, self._order_prompt, menu, pick_promotion)
+
+    @staticmethod
+    def _blocking(f, loop):
+        # calls the coroutine function f on the loop from a prompt thread
+        return lambda *args, **kwargs: asyncio.run_coroutine_threadsafe(f(*args, **kwargs), loop).result()
+
+    @Client._check_signed_in
+    async def get_price(self, food):
+        '''
+        returns the price of the current order
+        '''
+        self.food = food
+        response = await self._request("post", "ORDER_TOTAL", json=self._generate_json(food))
+        self._check_for_error(response)
+        self.food_price = response['Data']['OrderView']['TotalValue']
+        return response['Data']['OrderView']['TotalValue']
+
+    @Client._check_signed_in
+    async def quote_many(self, orders:list, store, workers:int=8):
+        '''
+        returns the totals for many orders at a store, pricing them
+        concurrently. equivalent orders are only priced once and cached
+        '''
+        keys = [self._quote_key(order, store) for order in orders]
+        totals = {}
+        missing = {}
+        for key, order in zip(keys, orders):
+            if key in totals or key in missing:
+                continue
+            total = self.quote_cache.get(key)
+            if total is None:
+                missing[key] = order
+            else:
+                totals[key] = total
+        quoted = await self._map(lambda order: self._quote(order, store), list(missing.values()), workers)
+        for key, total in zip(missing, quoted):
+            self.quote_cache.put(key, total)
+            totals[key] = total
+        return [totals[key] for key in keys]
+
+    async def _quote(self, order, store):
+        response = await self._request("post", "ORDER_TOTAL", json=self._generate_json(order, store=store))
+        self._check_for_error(response)
+        return response['Data']['OrderView']['TotalValue']
+
+    @Client._check_signed_in
+    async def order(self, card, food=None, store=None):
+        '''
+        Orders the food
+        '''
+        if food:
+            self.food = food
+        if store:
+            self.store = store
+        self.card = card
+        self.checkout = AsyncCheckout(self, card, self.food, self.store)
+        await self.checkout.place()
+        self.order_payment_id = self.checkout.order_payment_id
+        self.food_price = self.checkout.total
+        self.check_in_code = self.checkout.check_in_code
+
+    @Client._check_signed_in
+    async def pickup(self):
+        '''
+        CHARGES PAYMENT METHOD
+        Allows food for pickup and returns the order number.
+        '''
+        if self.checkout is None:
+            raise McDonaldsError('You must order before picking up.')
+        return await self.checkout.run()
+
+    async def _get_order_pickup(self, check_in_code):
+        await self._request("get", "ORDER_PICKUP", check_in_code, params=self._pickup_payload(), raw=True)
+
+    @Client._check_signed_in
+    async def cards(self):
+        '''
+        returns raw json for the cards that a user has on file
+        '''
+        response = await self._request("get", "PROFILE", params=self._cards_payload())
+        self._check_for_error(response)
+        return response['Data']['PaymentCard']
+
+class AsyncCheckout(Checkout):
+    '''
+    Checkout for an AsyncClient, every step is a coroutine
+    '''
+    def __init__(self, client, card, food, store):
+        super().__init__(client, card, food, store)
+        self._lock = asyncio.Lock()
+
+    async def _step(self, name:str, f):
+        async with self._lock:
+            if not self._should_run(name):
+                return
+            start = time.perf_counter()
+            try:
+                await f()
+            except Exception as e:
+                self._finished(name, start, e)
+                raise
+            self._finished(name, start)
+
+    async def place(self):
+        async def place():
+            self._placed(await self.client._request("post", "ORDER_INITIAL", json=self._place_payload()))
+        await self._step("place", place)
+
+    async def confirm(self):
+        async def confirm():
+            await self.client._get_order_pickup(self.check_in_code)
+            await self.client._request("post", "ORDER_INITIAL_CONFIRM", self.check_in_code, json=self.client._confirm_payload(self.store))
+        await self._step("confirm", confirm)
+
+    async def finalize(self):
+        async def finalize():
+            await self.client._get_order_pickup(self.check_in_code)
+            response = await self.client._request("post", "ORDER_FINAL", self.check_in_code, json=self._final_payload())
+            self.order_number = response["OrderNumber"]
+        await self._step("finalize", finalize)
+        return self.order_number
+
+    async def advance(self):
+        if not self.done:
+            await getattr(self, self.STEPS[self.STATES.index(self.state)])()
+
+    async def run(self):
+        while not self.done:
+            await self.advance()
+        return self.order_number
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+from models import Menu, _intern
+from storeindex import StoreIndex
+
+
+class MenuMatrix(object):
+    '''
+    menus for many stores at once. the catalog from Client.menu_catalog is
+    kept once, and each store only keeps its outages as a bitset (an int with
+    bit i set when the store is out of the i-th product), so memory grows
+    with outages instead of stores times catalog size
+    '''
+    def __init__(self, catalog):
+        self.catalog = [(_intern(category), tuple((_intern(name), _intern(id)) for name, id in entries)) for category, entries in catalog]
+        self.codes = list(dict.fromkeys(id for _, entries in self.catalog for _, id in entries))
+        self.bits = {code: i for i, code in enumerate(self.codes)}
+        self.stores = {}
+        self.outages = {}
+        self._index = None
+
+    def __len__(self):
+        return len(self.outages)
+
+    def _mask(self, codes):
+        mask = 0
+        for code in codes:
+            bit = self.bits.get(str(code))
+            if bit is not None:
+                mask |= 1 << bit
+        return mask
+
+    def _codes(self, mask:int):
+        return [code for code, bit in self.bits.items() if mask >> bit & 1]
+
+    def set(self, store, outages):
+        '''
+        sets the outages of a store, codes that are not in the catalog are ignored
+        '''
+        if store["id"] not in self.stores:
+            self._index = None
+        self.stores[store["id"]] = store
+        self.outages[store["id"]] = self._mask(outages)
+
+    def refresh(self, client, stores, workers:int=8):
+        '''
+        fetches the outages of every store with client.store_outages and
+        returns the diff against the previous outages
+        '''
+        stores = list(stores)
+        before = self.snapshot()
+        outages = client._map(client.store_outages, stores, workers)
+        for store, codes in zip(stores, outages):
+            self.set(store, codes)
+        return self.diff(before)
+
+    def snapshot(self):
+        '''
+        returns the current outages, to diff against later
+        '''
+        return dict(self.outages)
+
+    def diff(self, snapshot:dict):
+        '''
+        returns {store id: {"out": [...], "back": [...]}} for the stores whose
+        outages changed since the snapshot. stores that were not in it count
+        as having had no outages
+        '''
+        changes = {}
+        for id, mask in self.outages.items():
+            old = snapshot.get(id, 0)
+            if mask != old:
+                changes[id] = {"out": self._codes(mask & ~old), "back": self._codes(old & ~mask)}
+        return changes
+
+    def available(self, store_id:str, code:str):
+        '''
+        whether a store has a product on its menu
+        '''
+        bit = self.bits.get(str(code))
+        return bit is not None and not self.outages[store_id] >> bit & 1
+
+    def menu(self, store_id:str):
+        '''
+        returns the Menu of one store, the same as Client.menu
+        '''
+        mask = self.outages[store_id]
+        return Menu((category, [(name, id) for name, id in entries if not mask >> self.bits[id] & 1])
+                for category, entries in self.catalog)
+
+    def stores_with(self, code:str, latitude:float, longitude:float, range:float=8):
+        '''
+        returns the stores within range miles that have a product, closest first
+        '''
+        if self._index is None:
+            self._index = StoreIndex(self.stores.values())
+        return [store for store in self._index.within(latitude, longitude, range) if self.available(store["id"], code)]
+
+    def available_everywhere(self, store_ids):
+        '''
+        returns the products that every one of the stores has
+        '''
+        mask = 0
+        for id in store_ids:
+            mask |= self.outages[id]
+        return [code for code, bit in self.bits.items() if not mask >> bit & 1]
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+import bisect, threading, time
+from contextlib import contextmanager
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram(object):
+    def __init__(self, buckets:tuple=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value:float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for le, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            yield le, total
+
+class Observer(object):
+    '''
+    base class for request observers passed to Client(observers=[...]).
+    record is called once per api call, after it finished or failed
+    '''
+    def record(self, endpoint:str, method:str, elapsed:float, status:int=None, size:int=0, result_code:int=None, error:Exception=None):
+        pass
+
+class Metrics(Observer):
+    '''
+    collects per endpoint request counts, latency histograms, response bytes,
+    errors and result codes, and per flow timings from flow()
+    '''
+    def __init__(self, buckets:tuple=BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.endpoints = {}
+        self.flows = {}
+
+    def record(self, endpoint:str, method:str, elapsed:float, status:int=None, size:int=0, result_code:int=None, error:Exception=None):
+        failed = error is not None or (status or 0) >= 400 or result_code not in (None, 1)
+        with self.lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = {"requests": 0, "errors": 0, "bytes": 0, "result_codes": {}, "latency": Histogram(self.buckets)}
+            stats["requests"] += 1
+            stats["errors"] += failed
+            stats["bytes"] += size
+            stats["latency"].observe(elapsed)
+            if result_code is not None:
+                stats["result_codes"][result_code] = stats["result_codes"].get(result_code, 0) + 1
+
+    @contextmanager
+    def flow(self, name:str):
+        '''
+        times a whole user flow, e.g. with metrics.flow("order"): ...
+        '''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                if name not in self.flows:
+                    self.flows[name] = Histogram(self.buckets)
+                self.flows[name].observe(elapsed)
+
+    def snapshot(self):
+        '''
+        returns {endpoint: {"requests", "errors", "bytes", "result_codes", "mean"}}
+        '''
+        with self.lock:
+            return {endpoint: {"requests": stats["requests"], "errors": stats["errors"], "bytes": stats["bytes"],
+                    "result_codes": dict(stats["result_codes"]), "mean": stats["latency"].sum / stats["latency"].count}
+                    for endpoint, stats in self.endpoints.items()}
+
+    def prometheus(self, prefix:str="mcdonalds"):
+        '''
+        returns the metrics in the prometheus text exposition format
+        '''
+        lines = []
+        def metric(name, kind, help):
+            lines.append("# HELP {}_{} {}".format(prefix, name, help))
+            lines.append("# TYPE {}_{} {}".format(prefix, name, kind))
+        def histogram(name, label, histograms):
+            for key, hist in sorted(histograms.items()):
+                for le, count in hist.cumulative():
+                    lines.append('{}_{}_bucket{{{}="{}",le="{}"}} {}'.format(prefix, name, label, key, le, count))
+                lines.append('{}_{}_sum{{{}="{}"}} {}'.format(prefix, name, label, key, hist.sum))
+                lines.append('{}_{}_count{{{}="{}"}} {}'.format(prefix, name, label, key, hist.count))
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+            for name, key, help in (("requests_total", "requests", "Requests sent per endpoint."),
+                    ("request_errors_total", "errors", "Failed requests per endpoint."),
+                    ("response_bytes_total", "bytes", "Response bytes per endpoint.")):
+                metric(name, "counter", help)
+                for endpoint, stats in endpoints:
+                    lines.append('{}_{}{{endpoint="{}"}} {}'.format(prefix, name, endpoint, stats[key]))
+            metric("result_codes_total", "counter", "ResultCodes returned per endpoint.")
+            for endpoint, stats in endpoints:
+                for code, count in sorted(stats["result_codes"].items()):
+                    lines.append('{}_result_codes_total{{endpoint="{}",code="{}"}} {}'.format(prefix, endpoint, code, count))
+            metric("request_seconds", "histogram", "Request latency per endpoint.")
+            histogram("request_seconds", "endpoint", {endpoint: stats["latency"] for endpoint, stats in endpoints})
+            metric("flow_seconds", "histogram", "Duration of timed flows.")
+            histogram("flow_seconds", "flow", self.flows)
+        return "\n".join(lines) + "\n"
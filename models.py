@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+import sys
+from collections import OrderedDict
+from collections.abc import Mapping
+from types import MappingProxyType
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+class BoundedDict(OrderedDict):
+    '''
+    dict that forgets the least recently set keys past maxsize
+    '''
+    def __init__(self, maxsize:int=10000):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
+
+class Model(Mapping):
+    '''
+    base for the immutable models below. they are read only mappings, so
+    model["id"], dict(model) and model.items() work like the dicts the client
+    used to return. json.dumps needs default=json_default (the client codecs use it)
+    '''
+    __slots__ = ()
+    KEYS = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError("{} is immutable".format(type(self).__name__))
+
+    def _set(self, **values):
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __getitem__(self, key):
+        if key not in self.KEYS:
+            raise KeyError(key)
+        return self._get(key)
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def __len__(self):
+        return len(self.KEYS)
+
+    def to_dict(self):
+        return {key: self[key] for key in self.KEYS}
+
+    def copy(self):
+        '''
+        returns a mutable dict copy
+        '''
+        return self.to_dict()
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, self.to_dict())
+
+class Store(Model):
+    __slots__ = ("id", "status", "address", "latitude", "longitude", "distance", "phone")
+    KEYS = ("status", "address", "coordinates", "id", "distance", "phone")
+
+    def __init__(self, id:str, status:str, address:str, latitude:float, longitude:float, distance:float, phone:str):
+        self._set(id=_intern(id), status=_intern(status), address=address, latitude=latitude, longitude=longitude, distance=distance, phone=phone)
+
+    def _get(self, key):
+        if key == "coordinates":
+            return {"latitude": self.latitude, "longitude": self.longitude}
+        return getattr(self, key)
+
+    def __reduce__(self):
+        return (Store, (self.id, self.status, self.address, self.latitude, self.longitude, self.distance, self.phone))
+
+class MenuItem(Model):
+    __slots__ = ("name", "id", "category")
+    KEYS = ("name", "id", "category")
+
+    def __init__(self, name:str, id:str, category:str):
+        self._set(name=_intern(name), id=_intern(id), category=_intern(category))
+
+    def _get(self, key):
+        return getattr(self, key)
+
+    def __reduce__(self):
+        return (MenuItem, (self.name, self.id, self.category))
+
+class Menu(Mapping):
+    '''
+    a store menu, a read only mapping of category -> {item name: item id}.
+    the category mappings are read only too, dict(menu[category]) or
+    menu.to_dict() give mutable copies
+    '''
+    __slots__ = ("categories", "_index")
+
+    def __init__(self, categories):
+        object.__setattr__(self, "categories", tuple((_intern(category), tuple((_intern(name), _intern(id)) for name, id in entries))
+                for category, entries in categories))
+        object.__setattr__(self, "_index", None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Menu is immutable")
+
+    def __getitem__(self, category):
+        if self._index is None:
+            # built on first lookup, later lookups are a dict lookup
+            object.__setattr__(self, "_index", {name: MappingProxyType(dict(entries)) for name, entries in self.categories})
+        return self._index[category]
+
+    def __iter__(self):
+        return (category for category, _ in self.categories)
+
+    def __len__(self):
+        return len(self.categories)
+
+    def items_list(self):
+        '''
+        returns every item on the menu as MenuItems
+        '''
+        return [MenuItem(name, id, category) for category, entries in self.categories for name, id in entries]
+
+    def to_dict(self):
+        return {category: dict(entries) for category, entries in self.categories}
+
+    def copy(self):
+        return self.to_dict()
+
+    def __reduce__(self):
+        return (Menu, (self.categories,))
+
+    def __repr__(self):
+        return "Menu({})".format(self.to_dict())
+
+class ProductSet(Model):
+    __slots__ = ("alias", "any_product", "products", "action")
+    KEYS = ("Alias", "AnyProduct", "Products", "Action")
+
+    def __init__(self, alias:str, any_product:bool, products:tuple, action=None):
+        self._set(alias=_intern(alias), any_product=any_product, products=tuple(_intern(product) for product in products), action=action)
+
+    @classmethod
+    def from_json(cls, raw):
+        return cls(raw.get("Alias"), raw.get("AnyProduct", False), raw.get("Products") or (), raw.get("Action"))
+
+    def _get(self, key):
+        return getattr(self, {"Alias": "alias", "AnyProduct": "any_product", "Products": "products", "Action": "action"}[key])
+
+    def __reduce__(self):
+        return (ProductSet, (self.alias, self.any_product, self.products, self.action))
+
+class Offer(Model):
+    '''
+    an offer from Client.offers, the product sets are parsed on first use
+    and any other field of the raw json is available as offer["Field"]
+    '''
+    __slots__ = ("raw", "_product_sets")
+
+    def __init__(self, raw:dict):
+        self._set(raw=raw, _product_sets=None)
+
+    def __contains__(self, key):
+        return key in self.raw
+
+    def __iter__(self):
+        return iter(self.raw)
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __getitem__(self, key):
+        if key == "ProductSets":
+            return self.product_sets
+        return self.raw[key]
+
+    def __eq__(self, other):
+        if isinstance(other, (Offer, dict)):
+            return self.raw == (other.raw if isinstance(other, Offer) else other)
+        return NotImplemented
+
+    def to_dict(self):
+        return {key: [product_set.to_dict() for product_set in self.product_sets] if key == "ProductSets" else value
+                for key, value in self.raw.items()}
+
+    @property
+    def id(self):
+        return self.raw["Id"]
+
+    @property
+    def name(self):
+        return self.raw["Name"]
+
+    @property
+    def product_sets(self):
+        if self._product_sets is None:
+            self._set(_product_sets=tuple(ProductSet.from_json(product_set) for product_set in self.raw.get("ProductSets") or ()))
+        return self._product_sets
+
+    def __reduce__(self):
+        return (Offer, (self.raw,))
+
+class OrderLine(Model):
+    '''
+    a normal order line, {"id": product code, "quantity": amount}
+    '''
+    __slots__ = ("id", "quantity")
+    KEYS = ("id", "quantity")
+
+    def __init__(self, id:int, quantity:int=1):
+        self._set(id=int(id), quantity=quantity)
+
+    def _get(self, key):
+        return getattr(self, key)
+
+    def __reduce__(self):
+        return (OrderLine, (self.id, self.quantity))
+
+def json_default(obj):
+    '''
+    the default hook for json encoders, json.dumps(store, default=json_default)
+    '''
+    if isinstance(obj, (Model, Menu)):
+        return obj.to_dict()
+    if isinstance(obj, MappingProxyType):
+        return dict(obj)
+    raise TypeError("{} is not JSON serializable".format(type(obj).__name__))
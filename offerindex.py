@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+from collections import Counter
+from optimizer import _applies
+
+
+def _fingerprint(offer):
+    return tuple((product_set["Alias"], bool(product_set["AnyProduct"]), tuple(map(str, product_set["Products"] or ())))
+            for product_set in offer["ProductSets"])
+
+class OfferIndex(object):
+    '''
+    inverted index from product code to the offers (and their product sets)
+    that take it, built from Client.offers(). refresh only reindexes the
+    offers that were added, removed or changed
+    '''
+    def __init__(self, offers=()):
+        self.offers = {}
+        self.fingerprints = {}
+        self.postings = {} # code -> {(offer id, product set index)}
+        self.required = {} # offer id -> product set indexes that are not AnyProduct
+        self.any_only = set() # offers with only AnyProduct product sets
+        self.refresh(offers)
+
+    def __len__(self):
+        return len(self.offers)
+
+    def refresh(self, offers):
+        '''
+        updates the index to exactly the given offers
+        '''
+        offers = {offer["Id"]: offer for offer in offers}
+        for id in list(self.offers):
+            if id not in offers or _fingerprint(offers[id]) != self.fingerprints[id]:
+                self._remove(id)
+        for id, offer in offers.items():
+            if id not in self.offers:
+                self._add(offer)
+            else:
+                self.offers[id] = offer
+
+    def _add(self, offer):
+        id = offer["Id"]
+        self.offers[id] = offer
+        self.fingerprints[id] = fingerprint = _fingerprint(offer)
+        required = set()
+        for i, (alias, any_product, products) in enumerate(fingerprint):
+            if any_product:
+                continue
+            required.add(i)
+            for code in products:
+                self.postings.setdefault(code, set()).add((id, i))
+        self.required[id] = required
+        if not required:
+            self.any_only.add(id)
+
+    def _remove(self, id):
+        for i, (alias, any_product, products) in enumerate(self.fingerprints[id]):
+            for code in products:
+                postings = self.postings.get(code)
+                if postings:
+                    postings.discard((id, i))
+                    if not postings:
+                        del self.postings[code]
+        del self.offers[id], self.fingerprints[id], self.required[id]
+        self.any_only.discard(id)
+
+    def lookup(self, code):
+        '''
+        returns the (offer id, product set alias) pairs that take a product code
+        '''
+        return sorted((id, self.fingerprints[id][i][0]) for id, i in self.postings.get(str(code), ()))
+
+    def eligible(self, basket):
+        '''
+        returns the offers the basket of product codes qualifies for, i.e.
+        every product set of the offer can take a different basket item
+        '''
+        basket = Counter(str(code) for code in basket)
+        matched = {}
+        for code in basket:
+            for id, i in self.postings.get(code, ()):
+                matched.setdefault(id, set()).add(i)
+        candidates = [id for id, sets in matched.items() if sets == self.required[id]]
+        candidates += [id for id in self.any_only if basket]
+        # the cheap checks above can not tell if two product sets need the same item
+        return [self.offers[id] for id in sorted(candidates) if _applies(self.offers[id], basket)]
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+from collections import Counter
+
+
+class PriceTable(object):
+    '''
+    local prices. items maps product code -> price, deals maps offer id ->
+    price of the whole deal. a deal without a price costs its parts
+    '''
+    def __init__(self, items:dict, deals:dict=None):
+        self.items = {str(code): price for code, price in items.items()}
+        self.deals = deals or {}
+
+    def items_cost(self, counts):
+        return sum(self.items[code] * quantity for code, quantity in counts)
+
+    def deal_cost(self, deal):
+        if deal["id"] in self.deals:
+            return self.deals[deal["id"]]
+        return sum(self.items[str(part["id"])] for part in deal["parts"])
+
+    def price(self, order):
+        return self.items_cost((str(item["id"]), item["quantity"]) for item in order["normal"]) + \
+            sum(self.deal_cost(deal) for deal in order["deals"])
+
+    def price_many(self, orders:list):
+        return [self.price(order) for order in orders]
+
+class QuotePrices(object):
+    '''
+    prices orders with ORDER_TOTAL through Client.quote_many, so repeated
+    orders come from the quote cache
+    '''
+    def __init__(self, client, store, workers:int=8):
+        self.client = client
+        self.store = store
+        self.workers = workers
+
+    def price_many(self, orders:list):
+        return self.client.quote_many(orders, self.store, workers=self.workers)
+
+def _discount_type(offer):
+    # same as promotion_picker, the last product set with an action wins
+    discount_type = 0
+    for product_set in offer["ProductSets"]:
+        try:
+            discount_type = product_set["Action"]["DiscountType"]
+        except TypeError:
+            pass
+    return discount_type
+
+def _assignments(offer, remaining:Counter):
+    '''
+    yields every distinct (deal, remaining after the deal) for one offer,
+    each product set taking one of the remaining products
+    '''
+    product_sets = offer["ProductSets"]
+    seen = set()
+    def assign(j, remaining, parts):
+        if j == len(product_sets):
+            key = tuple(sorted((part["alias"] or "", part["id"]) for part in parts))
+            if key not in seen:
+                seen.add(key)
+                yield {"id": offer["Id"], "type": _discount_type(offer), "parts": parts}, remaining
+            return
+        product_set = product_sets[j]
+        products = remaining if product_set["AnyProduct"] else [code for code in dict.fromkeys(map(str, product_set["Products"])) if remaining[code]]
+        for code in list(products):
+            rest = remaining.copy()
+            rest[code] -= 1
+            if not rest[code]:
+                del rest[code]
+            yield from assign(j + 1, rest, parts + [{"id": int(code), "alias": product_set["Alias"]}])
+    yield from assign(0, remaining, [])
+
+def _order(deals:list, remaining:Counter):
+    return {"normal": [{"id": int(code), "quantity": quantity} for code, quantity in sorted(remaining.items())],
+            "deals": list(deals)}
+
+def _applies(offer, remaining:Counter):
+    return any(True for _ in _assignments(offer, remaining))
+
+def _deal_key(deal):
+    return (deal["id"], tuple(sorted((part["alias"] or "", part["id"]) for part in deal["parts"])))
+
+class _QuotedTable(PriceTable):
+    '''
+    a price table learned from quotes, with a price per deal assignment
+    '''
+    def deal_cost(self, deal):
+        return self.deals[_deal_key(deal)]
+
+def cheapest_order(wanted, offers:list, prices):
+    '''
+    finds the cheapest order for the wanted product codes (a list, repeat
+    codes for more than one) using any of the offers at most once each.
+    offers can also be an offerindex.OfferIndex to skip offers that do not apply.
+    returns (total, order) with order in the form used by get_price and order
+
+    with a PriceTable the search runs on the table. with other price sources
+    (QuotePrices) each wanted product and each way of using an offer is
+    quoted on its own in one batch, the search runs on those prices and the
+    order found is quoted once more for its total
+    '''
+    wanted = Counter(str(code) for code in wanted)
+    if hasattr(offers, "eligible"):
+        offers = offers.eligible(wanted.elements())
+    else:
+        offers = [offer for offer in offers if _applies(offer, wanted)]
+    if hasattr(prices, "deal_cost"):
+        return _cheapest_additive(wanted, offers, prices)
+    # a deal used on part of the basket is also a way to use it on the whole basket
+    deals = {}
+    for offer in offers:
+        for deal, _ in _assignments(offer, wanted):
+            deals.setdefault(_deal_key(deal), deal)
+    codes = sorted(wanted)
+    totals = prices.price_many([_order((), Counter({code: 1})) for code in codes] +
+            [_order((deal,), Counter()) for deal in deals.values()])
+    table = _QuotedTable(dict(zip(codes, totals)), dict(zip(deals, totals[len(codes):])))
+    _, order = _cheapest_additive(wanted, offers, table)
+    return prices.price_many([order])[0], order
+
+def _cheapest_additive(wanted:Counter, offers:list, prices):
+    memo = {}
+    def best(i, remaining):
+        key = (i, tuple(sorted(remaining.items())))
+        if key in memo:
+            return memo[key]
+        if i == len(offers):
+            result = (prices.items_cost(remaining.items()), ())
+        else:
+            result = best(i + 1, remaining)
+            for deal, rest in _assignments(offers[i], remaining):
+                cost = prices.deal_cost(deal)
+                if cost >= result[0]:
+                    continue
+                rest_cost, deals = best(i + 1, rest)
+                if cost + rest_cost < result[0]:
+                    result = (cost + rest_cost, (deal,) + deals)
+        memo[key] = result
+        return result
+    total, deals = best(0, wanted)
+    remaining = wanted.copy()
+    for deal in deals:
+        for part in deal["parts"]:
+            remaining[str(part["id"])] -= 1
+    return total, _order(deals, +remaining)
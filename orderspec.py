@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+import bisect, difflib, functools, re
+from mcdonald import McDonaldsError
+from optimizer import _discount_type
+
+
+def normalize(name:str):
+    '''
+    lower case with punctuation and trademark signs removed
+    '''
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", name.lower().replace("®", "").replace("™", "")).split())
+
+class ItemResolver(object):
+    '''
+    resolves item names or codes against a menu, trying an exact normalized
+    match, then a unique prefix, then the closest name when no name starts
+    with it. a prefix of more than one name raises. results are cached
+    '''
+    def __init__(self, menu, cutoff:float=0.75, cache_size:int=65536):
+        self.cutoff = cutoff
+        self.names = {}
+        self.display = {}
+        self.codes = set()
+        for category in menu:
+            for name, code in menu[category].items():
+                self.names.setdefault(normalize(name), str(code))
+                self.display.setdefault(normalize(name), name)
+                self.codes.add(str(code))
+        self.sorted_names = sorted(self.names)
+        self.resolve = functools.lru_cache(maxsize=cache_size)(self._resolve)
+
+    def _resolve(self, item):
+        '''
+        returns the product code for an item name or code
+        '''
+        item = str(item)
+        if item in self.codes:
+            return item
+        return self._match(item, self.names, self.sorted_names)
+
+    def resolve_in(self, item, codes):
+        '''
+        returns the product code for an item name or code that must be one of
+        codes, like the products of an offer product set. names are matched
+        only against the menu items among codes
+        '''
+        item = str(item)
+        codes = set(map(str, codes))
+        if item in codes:
+            return item
+        names = {name: code for name, code in self.names.items() if code in codes}
+        try:
+            return self._match(item, names, sorted(names))
+        except McDonaldsError:
+            if item not in self.codes and normalize(item) not in self.names:
+                raise
+        raise McDonaldsError("{} is not one of the products {}.".format(item, ", ".join(sorted(codes))))
+
+    def _match(self, item:str, names:dict, sorted_names:list):
+        name = normalize(item)
+        if name in names:
+            return names[name]
+        i = bisect.bisect_left(sorted_names, name)
+        prefixed = []
+        while name and i < len(sorted_names) and sorted_names[i].startswith(name):
+            prefixed.append(sorted_names[i])
+            i += 1
+        if len(prefixed) == 1:
+            return names[prefixed[0]]
+        if prefixed:
+            raise McDonaldsError("{} could be any of: {}.".format(item, ", ".join(self.display[name] for name in prefixed)))
+        close = difflib.get_close_matches(name, sorted_names, n=1, cutoff=self.cutoff)
+        if close:
+            return names[close[0]]
+        raise McDonaldsError("Could not find {} on the menu.".format(item))
+
+def _offer(offers, id):
+    if offers is None:
+        return None
+    if hasattr(offers, "offers"): # OfferIndex
+        return offers.offers.get(id)
+    for offer in offers:
+        if offer["Id"] == id:
+            return offer
+    return None
+
+def build_order(spec, resolver:ItemResolver, offers=None):
+    '''
+    turns a spec into {"normal": [...], "deals": [...]} for get_price and order.
+    items are names or codes, optionally as {"item", "quantity"}. an offer id
+    takes parts in product set order, or as {"alias", "item"}. with offers,
+    each part must be one of the products of its product set (any menu item
+    for AnyProduct sets). the deal type comes from spec["type"] or the
+    matching offer in offers
+    '''
+    normal = []
+    for line in spec.get("items", ()):
+        if not isinstance(line, dict):
+            line = {"item": line}
+        normal.append({"id": int(resolver.resolve(line["item"])), "quantity": line.get("quantity", 1)})
+    deals = []
+    if spec.get("offer") is not None:
+        offer = _offer(offers, spec["offer"])
+        if offers is not None and offer is None:
+            raise McDonaldsError("Offer {} is not available.".format(spec["offer"]))
+        product_sets = offer["ProductSets"] if offer else ()
+        parts = []
+        for i, part in enumerate(spec.get("parts", ())):
+            if not isinstance(part, dict):
+                part = {"item": part}
+            if offer is None:
+                parts.append({"id": int(resolver.resolve(part["item"])), "alias": part.get("alias")})
+                continue
+            if "alias" in part:
+                matching = [product_set for product_set in product_sets if product_set["Alias"] == part["alias"]]
+                if not matching:
+                    raise McDonaldsError("Offer {} has no {} part.".format(spec["offer"], part["alias"]))
+                product_set = matching[0]
+            elif i < len(product_sets):
+                product_set = product_sets[i]
+            else:
+                raise McDonaldsError("Offer {} only takes {} parts.".format(spec["offer"], len(product_sets)))
+            if product_set["AnyProduct"]:
+                code = resolver.resolve(part["item"])
+            else:
+                code = resolver.resolve_in(part["item"], product_set["Products"])
+            parts.append({"id": int(code), "alias": product_set["Alias"]})
+        deals.append({"id": spec["offer"], "type": spec.get("type", _discount_type(offer) if offer else 0), "parts": parts})
+    return {"normal": normal, "deals": deals}
+
+def build_orders(specs, resolver:ItemResolver, offers=None):
+    '''
+    build_order for many specs, names are resolved once thanks to the resolver cache
+    '''
+    return [build_order(spec, resolver, offers) for spec in specs]
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+import heapq, json, math
+from mcdonald import Client
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+RADIUS = 3959 # mi, same as Client._distance
+
+
+def _point(latitude:float, longitude:float):
+    '''
+    converts a coordinate into a point on the unit sphere, so the straight
+    line (chord) distance between points orders the same as the great circle one
+    '''
+    lat = math.radians(float(latitude))
+    lon = math.radians(float(longitude))
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+def _chord(miles:float):
+    return 2 * math.sin(min(miles / RADIUS, math.pi) / 2)
+
+class StoreIndex(object):
+    '''
+    in process k-d tree over stores returned by Client.find_stores, answering
+    nearest and within radius queries without calling the api
+    '''
+    def __init__(self, stores=()):
+        self.stores = {}
+        self.tree = None
+        self.add(stores)
+
+    def __len__(self):
+        return len(self.stores)
+
+    def add(self, stores):
+        '''
+        adds or replaces stores by id, the tree is rebuilt on the next query
+        '''
+        for store in stores:
+            self.stores[store["id"]] = store
+        self.tree = None
+
+    def _build(self):
+        self.entries = list(self.stores.values())
+        self.radians = None
+        self.points = [_point(store["coordinates"]["latitude"], store["coordinates"]["longitude"]) for store in self.entries]
+        def build(indexes, depth):
+            if not indexes:
+                return None
+            axis = depth % 3
+            indexes.sort(key=lambda i: self.points[i][axis])
+            middle = len(indexes) // 2
+            return (indexes[middle], axis, build(indexes[:middle], depth + 1), build(indexes[middle+1:], depth + 1))
+        self.tree = build(list(range(len(self.entries))), 0)
+
+    def _result(self, i:int, latitude:float, longitude:float):
+        store = dict(self.entries[i])
+        coordinates = store["coordinates"]
+        store["distance"] = Client._distance(float(latitude), float(longitude), coordinates["latitude"], coordinates["longitude"])
+        return store
+
+    def _nearest(self, target:tuple, k:int):
+        '''
+        returns the indexes of the k entries closest to a unit sphere point, closest first
+        '''
+        best = [] # max heap of (-squared chord, index)
+        stack = [self.tree]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            i, axis, left, right = node
+            point = self.points[i]
+            distance = sum((a - b) ** 2 for a, b in zip(point, target))
+            if len(best) < k:
+                heapq.heappush(best, (-distance, i))
+            elif distance < -best[0][0]:
+                heapq.heapreplace(best, (-distance, i))
+            delta = target[axis] - point[axis]
+            near, far = (left, right) if delta < 0 else (right, left)
+            # the far side is pushed first so the near side is searched first
+            if len(best) < k or delta * delta < -best[0][0]:
+                stack.append(far)
+            stack.append(near)
+        return [i for _, i in sorted(best, reverse=True)]
+
+    def nearest(self, latitude:float, longitude:float, k:int=1):
+        '''
+        returns the k nearest stores, closest first, with their distance in miles
+        '''
+        if k <= 0:
+            return []
+        if self.tree is None:
+            self._build()
+        return [self._result(i, latitude, longitude) for i in self._nearest(_point(latitude, longitude), k)]
+
+    def within(self, latitude:float, longitude:float, range:float=8):
+        '''
+        returns every store within range miles, closest first
+        '''
+        if self.tree is None:
+            self._build()
+        target = _point(latitude, longitude)
+        limit = _chord(range) ** 2
+        found = []
+        stack = [self.tree]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            i, axis, left, right = node
+            point = self.points[i]
+            distance = sum((a - b) ** 2 for a, b in zip(point, target))
+            if distance <= limit:
+                found.append((distance, i))
+            delta = target[axis] - point[axis]
+            stack.append(left if delta < 0 else right)
+            if delta * delta <= limit:
+                stack.append(right if delta < 0 else left)
+        return [self._result(i, latitude, longitude) for _, i in sorted(found)]
+
+    def nearest_many(self, coordinates:list, k:int=1, chunk_size:int=256):
+        '''
+        nearest for many (latitude, longitude) pairs at once. the k nearest
+        stores of each pair come from the tree, and with numpy installed their
+        haversine distances are computed a chunk of pairs at a time
+        '''
+        if k <= 0 or not self.stores:
+            return [[] for _ in coordinates]
+        if numpy is None:
+            return [self.nearest(latitude, longitude, k) for latitude, longitude in coordinates]
+        if self.tree is None:
+            self._build()
+        if self.radians is None:
+            self.radians = numpy.radians([(store["coordinates"]["latitude"], store["coordinates"]["longitude"]) for store in self.entries])
+        results = []
+        for start in range(0, len(coordinates), chunk_size):
+            chunk = numpy.asarray(coordinates[start:start+chunk_size], dtype=float)
+            closest = numpy.array([self._nearest(_point(latitude, longitude), k) for latitude, longitude in chunk])
+            lat1 = numpy.radians(chunk[:, 0])[:, None]
+            lon1 = numpy.radians(chunk[:, 1])[:, None]
+            lat2 = self.radians[closest, 0]
+            lon2 = self.radians[closest, 1]
+            a = numpy.sin((lat2 - lat1) / 2) ** 2 + numpy.cos(lat1) * numpy.cos(lat2) * numpy.sin((lon2 - lon1) / 2) ** 2
+            distances = 2 * RADIUS * numpy.arctan2(numpy.sqrt(a), numpy.sqrt(1 - a))
+            for indexes, row in zip(closest.tolist(), distances.tolist()):
+                stores = []
+                for i, distance in zip(indexes, row):
+                    store = dict(self.entries[i])
+                    store["distance"] = distance
+                    stores.append(store)
+                results.append(stores)
+        return results
+
+    def save(self, path:str):
+        with open(path, "w") as f:
+            json.dump([dict(store) for store in self.stores.values()], f)
+
+    @classmethod
+    def load(cls, path:str):
+        with open(path) as f:
+            return cls(json.load(f))
@@ -0,0 +1,70 @@
+import json, os, sys
+import pytest
+from requests import Request
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mcdonald import Client
+from transport import Cassette
+
+CATEGORIES = 6
+CARD = {"CustomerPaymentMethodId": 7, "PaymentMethodId": 3}
+
+
+def store(i:int):
+    return {"generalStatus": {"status": "OPEN"},
+        "address": {"addressLine1": "{} Main St".format(i), "cityTown": "Urbana", "subdivision": "IL", "postalZip": "61801",
+            "location": {"lat": str(40.1 + i * 0.01), "lon": str(-88.2 - i * 0.01)}},
+        "identifiers": {"storeIdentifier": [{"identifierValue": "x"}, {"identifierValue": str(1000 + i)}]},
+        "storeNumbers": {"phonenumber": [{"number": "217-555-0100"}]}}
+
+def category(i:int):
+    items = [{"item_name": "Item {}-{}".format(i, j), "external_id": str(100 + i * 10 + j), "do_not_show": "Core"} for j in range(3)]
+    items.append({"item_name": "Promo {}".format(i), "external_id": "{}-5".format(100 + i * 10), "do_not_show": "Promotional"})
+    return {"category": {"category_name": "Category {}".format(i), "items": {"item": items}}}
+
+def add(cassette:Cassette, method:str, endpoint:str, body, *args, status:int=200, params:dict=None, headers:dict=None):
+    url = Request(method, getattr(Client, endpoint).format(*args), params=params).prepare().url
+    cassette.add(method, url, status, dict({"Content-Type": "application/json"}, **(headers or {})), json.dumps(body))
+
+def make_cassette():
+    '''
+    a cassette shaped like the api responses of one account and store
+    '''
+    cassette = Cassette()
+    ok = {"ResultCode": 1}
+    menu = Client("test")._menu_payload()
+    add(cassette, "POST", "SIGN_IN", {**ok, "Data": {"AccessData": {"Token": "token"}, "CustomerData": {"ZipCode": "61801"}}})
+    add(cassette, "GET", "STORES", [store(i) for i in range(5)])
+    add(cassette, "GET", "STORE_INFO", {**ok, "Data": {"OutageProductCodes": ["101"]}})
+    add(cassette, "GET", "MENU_CATEGORIES", {"categories": {"category": [{"category_id": i} for i in range(CATEGORIES)]}},
+            params={**menu, "categoryType": 1})
+    for i in range(CATEGORIES):
+        add(cassette, "GET", "MENU_CATEGORY", category(i), params={**menu, "categoryId": i})
+    add(cassette, "GET", "LOOKUP_ITEM", {"items": {"item": [{"external_id": str(100 + i * 10), "item_name": "Item {}-0".format(i),
+            "do_not_show": "Core"} for i in range(CATEGORIES)]}})
+    add(cassette, "GET", "PROFILE", {**ok, "Data": {"PaymentCard": [CARD]}})
+    add(cassette, "POST", "ORDER_TOTAL", {**ok, "Data": {"OrderView": {"TotalValue": 5.37}}})
+    add(cassette, "POST", "ORDER_INITIAL", {"OrderView": {"OrderPaymentId": 1, "TotalValue": 5.37, "CheckInCode": "1234"}})
+    add(cassette, "GET", "ORDER_PICKUP", ok, "1234")
+    add(cassette, "POST", "ORDER_INITIAL_CONFIRM", ok, "1234")
+    add(cassette, "POST", "ORDER_FINAL", {"OrderNumber": 42}, "1234")
+    return cassette
+
+class CountingCassette(Cassette):
+    '''
+    counts the requests answered per (method, path suffix)
+    '''
+    def __init__(self, cassette:Cassette):
+        super().__init__(cassette.interactions)
+        self.sent = []
+
+    def find(self, method:str, url:str):
+        self.sent.append((method.upper(), self._split(url)[0]))
+        return super().find(method, url)
+
+    def count(self, method:str, endpoint:str, *args):
+        path = self._split(getattr(Client, endpoint).format(*args))[0]
+        return sum(1 for m, p in self.sent if m == method and p == path)
+
+@pytest.fixture
+def cassette():
+    return CountingCassette(make_cassette())
@@ -0,0 +1,105 @@
+import pytest
+from conftest import CARD, CountingCassette, add, make_cassette
+from mcdonald import Checkout, CheckoutExecutor, Client, FallbackGeocoder, McDonaldsError, RetryPolicy, TamuGeocoder, ZipTableGeocoder
+from metrics import Metrics
+from transport import ReplayAdapter
+
+ORDER = {"normal": [{"id": 100, "quantity": 2}], "deals": [{"id": -1, "type": 2, "parts": [{"id": 110, "alias": "Sandwich"}]}]}
+
+
+def signed_in(cassette, **kwargs):
+    client = Client("test", adapter=ReplayAdapter(cassette), **kwargs)
+    client.sign_in("test@example.com", "password")
+    return client
+
+def test_order_flow(cassette):
+    client = signed_in(cassette)
+    assert client.token == "token" and client.zip_code == "61801"
+    stores = client.find_stores(40.1, -88.2)
+    assert [store["id"] for store in stores] == ["1000", "1001", "1002", "1003", "1004"]
+    assert stores[0]["distance"] == pytest.approx(0)
+    menu = client.menu(stores[0])
+    assert menu["Category 0"] == {"Item 0-0": "100", "Item 0-2": "102"} # 101 is out
+    assert client.get_price(ORDER) == 5.37
+    card = client.cards()[0]
+    client.order(card, ORDER, store=stores[0])
+    assert (client.check_in_code, client.order_payment_id, client.food_price) == ("1234", 1, 5.37)
+    assert client.pickup() == 42
+    assert cassette.count("POST", "ORDER_INITIAL") == 1
+    assert cassette.count("POST", "ORDER_FINAL", "1234") == 1
+
+@pytest.mark.parametrize("show_promotions, lookup_promo_bases", [(False, False), (True, False), (True, True)])
+def test_menu_is_the_same_with_workers(cassette, show_promotions, lookup_promo_bases):
+    client = signed_in(cassette)
+    store = client.find_stores(40.1, -88.2)[0]
+    serial = client.menu(store, show_promotions, lookup_promo_bases)
+    parallel = signed_in(cassette).menu(store, show_promotions, lookup_promo_bases, workers=4)
+    assert parallel == serial
+    assert list(parallel) == list(serial)
+    assert [list(parallel[category]) for category in parallel] == [list(serial[category]) for category in serial]
+
+def test_checkout_steps_are_guarded(cassette):
+    client = signed_in(cassette)
+    store = client.find_stores(40.1, -88.2)[0]
+    checkout = Checkout(client, CARD, ORDER, store)
+    with pytest.raises(McDonaldsError):
+        checkout.finalize()
+    assert checkout.state == "new"
+    checkout.place()
+    checkout.place()
+    assert cassette.count("POST", "ORDER_INITIAL") == 1
+    assert checkout.run() == 42
+    checkout.confirm()
+    assert checkout.finalize() == 42
+    assert cassette.count("POST", "ORDER_INITIAL_CONFIRM", "1234") == 1
+    assert cassette.count("POST", "ORDER_FINAL", "1234") == 1
+    assert set(checkout.timings) == {"place", "confirm", "finalize"}
+
+def test_failed_checkout_is_not_resent(cassette):
+    client = signed_in(cassette)
+    store = client.find_stores(40.1, -88.2)[0]
+    bad = Checkout(client, {}, ORDER, store) # no payment method id
+    good = Checkout(client, CARD, ORDER, store)
+    CheckoutExecutor(workers=2).run([bad, good])
+    assert good.state == "finalized" and good.order_number == 42
+    assert bad.state == "failed" and isinstance(bad.error, KeyError)
+    with pytest.raises(McDonaldsError):
+        bad.finalize()
+    assert cassette.count("POST", "ORDER_INITIAL") == 2
+
+def flaky(endpoint, method, body, *args):
+    '''
+    a cassette answering endpoint with a 503 before body
+    '''
+    cassette = make_cassette()
+    cassette.interactions = [i for i in cassette.interactions if not i["path"].endswith(getattr(Client, endpoint).format(*args)[len(Client.BASE):])]
+    add(cassette, method, endpoint, {"error": "unavailable"}, *args, status=503, headers={"Retry-After": "0"})
+    add(cassette, method, endpoint, body, *args)
+    return CountingCassette(cassette)
+
+def test_get_is_retried():
+    cassette = flaky("STORES", "GET", [])
+    client = signed_in(cassette, retry=RetryPolicy(attempts=2, backoff=0))
+    assert client.find_stores(40.1, -88.2) == []
+    assert cassette.count("GET", "STORES") == 2
+
+def test_order_is_not_retried():
+    cassette = flaky("ORDER_INITIAL", "POST", {"OrderView": {"OrderPaymentId": 1, "TotalValue": 5.37, "CheckInCode": "1234"}})
+    client = signed_in(cassette, retry=RetryPolicy(attempts=2, backoff=0))
+    store = client.find_stores(40.1, -88.2)[0]
+    with pytest.raises(KeyError):
+        client.order(CARD, ORDER, store=store)
+    assert client.checkout.state == "failed"
+    assert cassette.count("POST", "ORDER_INITIAL") == 1
+
+@pytest.mark.parametrize("fallback", [False, True])
+def test_zip_lookup_goes_through_the_client(cassette, tmp_path, fallback):
+    add(cassette, "GET", "ZIP_LOOKUP", {"OutputGeocodes": [{"OutputGeocode": {"Latitude": "40.11", "Longitude": "-88.2"}}]})
+    table = tmp_path / "zips.csv"
+    table.write_text("zip,lat,lon\n10001,40.75,-73.99\n")
+    metrics = Metrics()
+    geocoder = FallbackGeocoder(ZipTableGeocoder(str(table)), TamuGeocoder(Client.ZIP_LOOKUP)) if fallback else None
+    client = signed_in(cassette, observers=[metrics], geocoder=geocoder)
+    assert client.lookup_zip() == ("40.11", "-88.2")
+    assert cassette.count("GET", "ZIP_LOOKUP") == 1
+    assert metrics.snapshot()["ZIP_LOOKUP"]["requests"] == 1
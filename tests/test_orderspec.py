@@ -0,0 +1,25 @@
+import pytest
+from mcdonald import McDonaldsError
+from models import Menu, Offer
+from orderspec import ItemResolver, build_order
+
+MENU = Menu([("Sandwiches", [("Big Mac®", "100"), ("Quarter Pounder® with Cheese", "101")]), ("Drinks", [("Coca-Cola®", "200")])])
+OFFER = Offer({"Id": -5, "Name": "Sandwich deal", "ProductSets": [
+    {"Alias": "Sandwich", "AnyProduct": False, "Products": [4314, 4315, 100], "Action": {"DiscountType": 2}},
+    {"Alias": "Drink", "AnyProduct": True, "Products": [], "Action": None}]})
+
+
+@pytest.fixture
+def resolver():
+    return ItemResolver(MENU)
+
+def test_parts_take_offer_codes_and_names(resolver):
+    order = build_order({"offer": -5, "parts": [4314, "coca cola"]}, resolver, [OFFER])
+    assert order["deals"] == [{"id": -5, "type": 2, "parts": [{"id": 4314, "alias": "Sandwich"}, {"id": 200, "alias": "Drink"}]}]
+    order = build_order({"offer": -5, "parts": [{"alias": "Sandwich", "item": "big mac"}]}, resolver, [OFFER])
+    assert order["deals"][0]["parts"] == [{"id": 100, "alias": "Sandwich"}]
+
+@pytest.mark.parametrize("parts", [["Coca-Cola", "Big Mac"], [101], ["Big Mac", "Coca-Cola", "Big Mac"], [{"alias": "Side", "item": "Coca-Cola"}]])
+def test_parts_outside_the_offer_raise(resolver, parts):
+    with pytest.raises(McDonaldsError):
+        build_order({"offer": -5, "parts": parts}, resolver, [OFFER])
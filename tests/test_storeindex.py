@@ -0,0 +1,56 @@
+import random
+import pytest
+from mcdonald import Client
+from models import Store
+from storeindex import StoreIndex
+
+
+def brute_force(stores, latitude, longitude):
+    return sorted((Client._distance(latitude, longitude, store.latitude, store.longitude), store.id) for store in stores)
+
+@pytest.fixture(scope="module")
+def stores():
+    rng = random.Random(7)
+    return [Store(str(i), "OPEN", "", rng.uniform(25, 49), rng.uniform(-124, -67), 0, "") for i in range(2000)]
+
+@pytest.mark.parametrize("seed", range(5))
+def test_nearest_matches_brute_force(stores, seed):
+    rng = random.Random(seed)
+    index = StoreIndex(stores)
+    for _ in range(20):
+        latitude, longitude = rng.uniform(25, 49), rng.uniform(-124, -67)
+        expected = brute_force(stores, latitude, longitude)[:5]
+        found = index.nearest(latitude, longitude, k=5)
+        assert [store["id"] for store in found] == [id for _, id in expected]
+        assert [store["distance"] for store in found] == pytest.approx([distance for distance, _ in expected])
+
+@pytest.mark.parametrize("range_", [1, 25, 150])
+def test_within_matches_brute_force(stores, range_):
+    rng = random.Random(range_)
+    index = StoreIndex(stores)
+    for _ in range(20):
+        latitude, longitude = rng.uniform(25, 49), rng.uniform(-124, -67)
+        expected = [id for distance, id in brute_force(stores, latitude, longitude) if distance <= range_]
+        assert [store["id"] for store in index.within(latitude, longitude, range_)] == expected
+
+def test_nearest_many_matches_nearest(stores):
+    index = StoreIndex(stores)
+    coordinates = [(30 + i, -100 + i) for i in range(10)]
+    many = index.nearest_many(coordinates, k=3)
+    assert [[store["id"] for store in found] for found in many] == \
+        [[store["id"] for store in index.nearest(latitude, longitude, k=3)] for latitude, longitude in coordinates]
+
+def test_nearest_many_matches_brute_force(stores):
+    rng = random.Random(11)
+    index = StoreIndex(stores)
+    coordinates = [(rng.uniform(25, 49), rng.uniform(-124, -67)) for _ in range(300)]
+    for (latitude, longitude), found in zip(coordinates, index.nearest_many(coordinates, k=4, chunk_size=64)):
+        expected = brute_force(stores, latitude, longitude)[:4]
+        assert [store["id"] for store in found] == [id for _, id in expected]
+        assert [store["distance"] for store in found] == pytest.approx([distance for distance, _ in expected])
+
+def test_no_neighbours(stores):
+    index = StoreIndex(stores)
+    assert index.nearest(40, -88, k=0) == []
+    assert index.nearest_many([(40, -88)], k=0) == [[]]
+    assert StoreIndex().nearest_many([(40, -88)], k=2) == [[]]
@@ -0,0 +1,62 @@
+import asyncio, json
+import pytest
+from mcdonald import Client, JsonArrayParser
+from mcdonald_async import AsyncClient
+
+ITEMS = [{"name": "Big Mac®, [large]", "id": 1}, "a ] string, with commas", [1, [2, 3]], 12345, -0.5, True, None, {}]
+TEXT = json.dumps(ITEMS, ensure_ascii=False)
+
+
+class Response(object):
+    def __init__(self, text:str):
+        self.encoding = "utf-8"
+        self.text = text
+
+    def iter_content(self, chunk_size:int, decode_unicode:bool=False):
+        return (self.text[i:i+chunk_size] for i in range(0, len(self.text), chunk_size))
+
+class Content(object):
+    def __init__(self, data:bytes):
+        self.data = data
+
+    async def iter_chunked(self, chunk_size:int):
+        for i in range(0, len(self.data), chunk_size):
+            yield self.data[i:i+chunk_size]
+
+class AsyncResponse(object):
+    charset = "utf-8"
+
+    def __init__(self, text:str):
+        self.content = Content(text.encode())
+
+def async_items(text:str, chunk_size:int):
+    async def collect():
+        return [item async for item in AsyncClient._iter_array(AsyncResponse(text), chunk_size)]
+    return asyncio.run(collect())
+
+def test_every_split():
+    for i in range(len(TEXT) + 1):
+        parser = JsonArrayParser()
+        assert parser.feed(TEXT[:i]) + parser.feed(TEXT[i:]) == ITEMS
+        parser.close()
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 4096])
+def test_chunk_sizes(chunk_size):
+    assert list(Client._iter_array(Response(TEXT), chunk_size)) == ITEMS
+    assert async_items(TEXT, chunk_size) == ITEMS
+
+@pytest.mark.parametrize("text", ["[]", " [ ] ", "[\n]"])
+def test_empty_array(text):
+    assert list(Client._iter_array(Response(text), 1)) == []
+    assert async_items(text, 1) == []
+
+@pytest.mark.parametrize("text", [TEXT[:-1], TEXT[:len(TEXT) // 2], "[", "[12", ""])
+def test_truncated_body(text):
+    with pytest.raises(ValueError):
+        list(Client._iter_array(Response(text), 3))
+    with pytest.raises(ValueError):
+        async_items(text, 3)
+
+def test_not_an_array():
+    with pytest.raises(ValueError):
+        list(Client._iter_array(Response('{"error": "x"}'), 4))
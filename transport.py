@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+import json, threading, time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl
+from requests import Response
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from mcdonald import McDonaldsError
+
+
+class Cassette(object):
+    '''
+    recorded request / response pairs. responses are matched by method, path
+    and query, falling back to method and path only. when several responses
+    match they are returned in turn
+    '''
+    def __init__(self, interactions:list=None):
+        self.interactions = interactions or []
+        self.lock = threading.Lock()
+        self.turns = {}
+
+    @classmethod
+    def load(cls, path:str):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def save(self, path:str):
+        with open(path, "w") as f:
+            json.dump(self.interactions, f, indent=1)
+
+    @staticmethod
+    def _split(url:str):
+        url = urlsplit(url)
+        return url.path, sorted(parse_qsl(url.query, keep_blank_values=True))
+
+    def add(self, method:str, url:str, status:int, headers:dict, body:str):
+        path, query = self._split(url)
+        # the body is stored decoded
+        headers = {name: value for name, value in headers.items() if name.lower() not in ("content-encoding", "transfer-encoding", "content-length")}
+        with self.lock:
+            self.interactions.append({"method": method.upper(), "path": path, "query": query,
+                "status": status, "headers": headers, "body": body})
+
+    def find(self, method:str, url:str):
+        path, query = self._split(url)
+        method = method.upper()
+        # the stand in server may live under another prefix than the recording
+        matches = [i for i in self.interactions if i["method"] == method and path.endswith(i["path"])]
+        exact = [i for i in matches if [list(q) for q in i["query"]] == [list(q) for q in query]]
+        matches = exact or matches
+        if not matches:
+            raise McDonaldsError("No recorded response for {} {}.".format(method, url))
+        key = (method, path, str(query) if exact else None)
+        with self.lock:
+            turn = self.turns.get(key, 0)
+            self.turns[key] = turn + 1
+        return matches[turn % len(matches)]
+
+class RecordingAdapter(HTTPAdapter):
+    '''
+    sends requests normally and records them in a cassette,
+    use with Client(..., adapter=RecordingAdapter(cassette))
+    '''
+    def __init__(self, cassette:Cassette, **kwargs):
+        self.cassette = cassette
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        self.cassette.add(request.method, request.url, response.status_code, response.headers, response.content.decode("utf-8", "replace"))
+        return response
+
+class ReplayAdapter(BaseAdapter):
+    '''
+    answers requests from a cassette without any network,
+    use with Client(..., adapter=ReplayAdapter(cassette))
+    '''
+    def __init__(self, cassette:Cassette, latency:float=0):
+        super().__init__()
+        self.cassette = cassette
+        self.latency = latency
+
+    def send(self, request, **kwargs):
+        interaction = self.cassette.find(request.method, request.url)
+        if self.latency:
+            time.sleep(self.latency)
+        response = Response()
+        response.status_code = interaction["status"]
+        response.headers = CaseInsensitiveDict(interaction["headers"])
+        response._content = interaction["body"].encode("utf-8")
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+class StandInServer(object):
+    '''
+    local http server answering from a cassette after latency seconds,
+    use with Client(..., base=server.base)
+    '''
+    def __init__(self, cassette:Cassette, latency:float=0, host:str="127.0.0.1", port:int=0):
+        self.cassette = cassette
+        self.latency = latency
+        server = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _answer(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    self.rfile.read(length)
+                try:
+                    interaction = server.cassette.find(self.command, self.path)
+                except McDonaldsError as e:
+                    interaction = {"status": 404, "headers": {}, "body": json.dumps({"error": str(e)})}
+                if server.latency:
+                    time.sleep(server.latency)
+                body = interaction["body"].encode("utf-8")
+                self.send_response(interaction["status"])
+                for name, value in interaction["headers"].items():
+                    if name.lower() not in ("content-length", "content-encoding", "transfer-encoding", "connection"):
+                        self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            do_GET = do_POST = _answer
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base(self):
+        host, port = self.httpd.server_address[:2]
+        return "http://{}:{}/v3".format(host, port)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()